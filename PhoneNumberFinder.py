@@ -1,30 +1,73 @@
-import time
-import urllib.parse  # Added for URL encoding
+import argparse
+import threading
 import pandas as pd
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 
-def init_driver():
+from browser_pool import BrowserPool
+from enrich import DEFAULT_SOURCES, load_known_stores
+from fetcher import fetch_all
+from metrics import add_metrics_arguments, finish_run, get_metrics, start_run
+from serp import PHONE_XPATH, WEBSITE_XPATH, CLOSED_MARKERS, build_query, search_url, phone_from_label, fetch_info
+
+# Only one worker at a time may block on the console for a CAPTCHA
+_captcha_lock = threading.Lock()
+_driver_path = None
+
+def init_driver(headless=False):
+    global _driver_path
     # Set up Chrome options
     chrome_options = Options()
-    # Uncomment the next line to run headless mode if needed:
-    # chrome_options.add_argument("--headless")
+    if headless:
+        chrome_options.add_argument("--headless=new")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--window-size=1920,1080")
     
     # If you need to load a CRX extension, uncomment below and update the path:
     chrome_options.add_extension("C:/chromedriver/NopeCHA-CAPTCHA-Solver-Chrome-Web-Store.crx")
     
-    service = Service(ChromeDriverManager().install())
+    # Resolve chromedriver once rather than once per pooled browser
+    if _driver_path is None:
+        _driver_path = ChromeDriverManager().install()
+    service = Service(_driver_path)
     driver = webdriver.Chrome(service=service, options=chrome_options)
     driver.maximize_window()
     return driver
 
+# True once the results page (or Google's CAPTCHA page) has finished rendering
+RESULTS_RENDERED_JS = """
+return document.readyState === 'complete' &&
+    !!document.querySelector('#search, #rso, #captcha-form, #recaptcha');
+"""
+
+# Reads phone, website and closed status in one WebDriver round trip; missing fields come back null
+EXTRACT_FIELDS_JS = """
+const first = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const phone = first(arguments[0]);
+const website = first(arguments[1]);
+let closed = null;
+for (const marker of arguments[2]) {
+    if (first(`//*[contains(text(), '${marker}')]`)) { closed = marker; break; }
+}
+return {
+    phone: phone ? phone.getAttribute('aria-label') : null,
+    website: website ? website.href : null,
+    closed: closed
+};
+"""
+
+def wait_for_results(driver, timeout=15):
+    try:
+        WebDriverWait(driver, timeout).until(lambda d: d.execute_script(RESULTS_RENDERED_JS))
+    except TimeoutException:
+        get_metrics().record_error('timeout')
+        print("[!] Results page did not finish rendering; reading what is there")
+
 def extract_info(driver, store_name, address, city, state, postal_code):
     """
     Constructs a Google search query using the store name and address details,
@@ -32,110 +75,113 @@ def extract_info(driver, store_name, address, city, state, postal_code):
     website URL, and closed status.
     """
     # Build the query string; note that if store_name contains "&", it needs encoding.
-    query = f"{store_name}, {address}, {city}, {state} {postal_code} phone"
-    # URL-encode the entire query so special characters like & are preserved.
-    encoded_query = urllib.parse.quote_plus(query)
-    search_url = "https://www.google.com/search?q=" + encoded_query + "&hl=en"
+    query = build_query(store_name, address, city, state, postal_code)
+    url = search_url(query)
     print(f"\nSearching for: {query}")
-    print(f"Encoded Search URL: {search_url}")
+    print(f"Encoded Search URL: {url}")
     
-    driver.get(search_url)
-    time.sleep(3)  # Allow time for the page to load
+    metrics = get_metrics()
+    with metrics.stage('browser_wait'):
+        driver.get(url)
+        wait_for_results(driver)
     
     # Check for CAPTCHA or robot verification (if present, wait for manual intervention)
     if "unusual traffic" in driver.title.lower():
-        print("[!] CAPTCHA detected. Please solve it manually and press Enter...")
-        input()
-    
-    phone = None
-    website = None
-    is_closed = False
+        metrics.record_error('captcha')
+        with _captcha_lock:
+            print("[!] CAPTCHA detected. Please solve it manually and press Enter...")
+            input()
+        wait_for_results(driver)
 
-    # --- Extract Phone Number ---
-    try:
-        phone_element = WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "//span[contains(@aria-label, 'Call phone number')]")
-            )
-        )
-        aria_label = phone_element.get_attribute("aria-label")
+    with metrics.stage('parse'):
+        fields = driver.execute_script(EXTRACT_FIELDS_JS, PHONE_XPATH, WEBSITE_XPATH, CLOSED_MARKERS) or {}
+
+    phone = None
+    aria_label = fields.get("phone")
+    if aria_label:
         print("Found phone aria-label:", aria_label)
-        if aria_label.startswith("Call phone number "):
-            phone = aria_label[len("Call phone number "):].strip()
-        else:
-            phone = aria_label.strip()
-    except Exception as e:
-        print(f"[!] Phone extraction error for query '{query}': {e}")
-
-    # --- Extract Website URL ---
-    try:
-        website_element = WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "//div[contains(@class, 'IzNS7c')]//a[contains(@class, 'ab_button') and .//div[text()='Website']]")
-            )
-        )
-        website = website_element.get_attribute("href")
+        phone = phone_from_label(aria_label)
+
+    website = fields.get("website")
+    if website:
         print("Found website:", website)
-    except Exception as e:
-        print(f"[!] Website extraction error for query '{query}': {e}")
 
-    # --- Check Closed Status (Permanently or Temporarily closed) ---
-    try:
-        # Look for "Permanently closed"
-        closed_element = driver.find_element(By.XPATH, "//*[contains(text(), 'Permanently closed')]")
-        if closed_element:
-            is_closed = True
-            print("Business is marked as Permanently closed.")
-    except Exception:
-        try:
-            # Look for "Temporarily closed"
-            closed_element = driver.find_element(By.XPATH, "//*[contains(text(), 'Temporarily closed')]")
-            if closed_element:
-                is_closed = True
-                print("Business is marked as Temporarily closed.")
-        except Exception:
-            is_closed = False
+    is_closed = fields.get("closed") is not None
+    if is_closed:
+        print(f"Business is marked as {fields['closed']}.")
 
     return phone, website, is_closed
 
+def lookup_row(driver, store_name, address, city, state, postal_code):
+    phone, website, is_closed = extract_info(driver, store_name, address, city, state, postal_code)
+    print(f"\n{store_name}: --> Phone: {phone} | Website: {website} | Closed: {is_closed}")
+    return phone, website, is_closed
+
 def main():
-    driver = init_driver()
-    
+    parser = argparse.ArgumentParser(description="Look up phone numbers and websites for stores.xlsx via Google.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of Chrome instances to run in parallel")
+    parser.add_argument("--headless", action="store_true", help="Run the browsers without a window")
+    parser.add_argument("--delay", type=float, default=2.0, help="Seconds each browser waits between queries")
+    parser.add_argument("--no-http", action="store_true", help="Skip the plain-HTTP fast path and use the browser for every row")
+    parser.add_argument("--http-rate", type=float, default=1.0, help="Max plain-HTTP lookups per second")
+    parser.add_argument("--known", nargs="*", default=DEFAULT_SOURCES,
+                        help="Sweep outputs and past results to fill phone/website from before searching (none to skip)")
+    parser.add_argument("--match-threshold", type=float, default=0.85,
+                        help="Minimum name/address similarity (0-1) for a known store to count as the same store")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics = start_run('PhoneNumberFinder.py', args)
+
     # Input Excel file must have columns: Store Name, Address, City, State, PostalCode
     input_file = "stores.xlsx"
     output_file = "stores_with_info.xlsx"
     df = pd.read_excel(input_file)
-    
-    phones = []
-    websites = []
-    closed_status = []
-    
+
+    tasks = []
     for idx, row in df.iterrows():
-        store_name = row["Store Name"]
-        address = row["Address"]
-        city = row["City"]
-        state = row["State"]
-        postal_code = str(row["PostalCode"])
-        
-        print(f"\nProcessing: {store_name}, {address}, {city}, {state} {postal_code}")
-        phone, website, is_closed = extract_info(driver, store_name, address, city, state, postal_code)
-        print(f"--> Phone: {phone}")
-        print(f"--> Website: {website}")
-        print(f"--> Closed status: {is_closed}")
-        
-        phones.append(phone)
-        websites.append(website)
-        closed_status.append(is_closed)
-        
-        time.sleep(2)  # Delay between queries
-    
-    df["Phone Number"] = phones
-    df["Website"] = websites
-    df["Closed"] = closed_status
-    df.to_excel(output_file, index=False)
+        tasks.append((idx, (row["Store Name"], row["Address"], row["City"], row["State"], str(row["PostalCode"]))))
+
+    # Results are keyed by row index so the output keeps the stores.xlsx order
+    results = {}
+    if args.known:
+        # Cheapest path: stores the API sweeps or an earlier run already resolved
+        with metrics.stage('match'):
+            known = load_known_stores(args.known, args.match_threshold)
+            for idx, row_args in tasks:
+                info = known.match(*row_args)
+                if info is not None:
+                    results[idx] = info
+        tasks = [(idx, row) for idx, row in tasks if idx not in results]
+        metrics.count('known_resolved', len(results))
+        print(f"\nKnown stores resolved {len(results)} rows; {len(tasks)} left to search")
+
+    if tasks and not args.no_http:
+        # Fast path: plain HTTP + lxml; only rows it can't resolve go to a browser
+        found = fetch_all([row_args for _, row_args in tasks], fetch_info, "www.google.com",
+                          concurrency=max(1, args.workers) * 2, rate=args.http_rate)
+        resolved = 0
+        for (idx, _), info in zip(tasks, found):
+            if info is not None:
+                results[idx] = info
+                resolved += 1
+        tasks = [(idx, row) for idx, row in tasks if idx not in results]
+        metrics.count('http_resolved', resolved)
+        print(f"\nHTTP fast path resolved {resolved} rows; {len(tasks)} need a browser")
+
+    if tasks:
+        pool = BrowserPool(lambda: init_driver(args.headless), workers=args.workers, delay=args.delay)
+        results.update(pool.run(tasks, lookup_row, default=(None, None, False)))
+        print(f"\nFinished {len(tasks)} browser lookups ({pool.restarts} browser restarts)")
+
+    # A row no lookup finished for still gets written, just without info
+    default = (None, None, False)
+    df["Phone Number"] = [results.get(idx, default)[0] for idx in df.index]
+    df["Website"] = [results.get(idx, default)[1] for idx in df.index]
+    df["Closed"] = [results.get(idx, default)[2] for idx in df.index]
+    with metrics.stage('write'):
+        df.to_excel(output_file, index=False)
     print(f"\nResults saved to {output_file}")
-    
-    driver.quit()
+    finish_run(args)
 
 if __name__ == "__main__":
     main()
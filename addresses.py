@@ -0,0 +1,114 @@
+import re
+
+import pandas as pd
+
+_TAGS = re.compile(r'\s*<[^>]+>\s*')
+_COUNTRY = re.compile(r'[\s,]*(?:United States(?: of America)?|USA|US)\s*$', re.I)
+_SPACES = re.compile(r'\s+')
+
+STATE_CODES = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
+    'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'District of Columbia': 'DC',
+    'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL',
+    'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA',
+    'Maine': 'ME', 'Maryland': 'MD', 'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN',
+    'Mississippi': 'MS', 'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
+    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY',
+    'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK', 'Oregon': 'OR',
+    'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD',
+    'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT', 'Virginia': 'VA',
+    'Washington': 'WA', 'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY',
+}
+
+# "<head> ST 12345" / "<head>, ST, 12345-6789" / "<head>, California 94534"
+_STATE_ZIP = re.compile(
+    r'^(?P<head>.*?)[\s,]*\b(?P<state>[A-Z][A-Za-z]|' + '|'.join(sorted(STATE_CODES, key=len, reverse=True)) + r')'
+    r'\s*,?\s*(?P<zip>\d{5})(?:-\d{4})?$'
+)
+
+# When the city is comma-separated from the street it is the last segment,
+# less any unit number left in front of it ("Suite 101 Cannon Beach")
+_LAST_SEGMENT = re.compile(r'(?:^|,)\s*(?P<segment>[^,]*?)\s*$')
+_AFTER_LAST_NUMBER = re.compile(r'(?:^|\s)\S*\d\S*\s+(?P<city>[^\d,#]+?)\s*$')
+
+# Otherwise the city is the run of digit-free words after the last street suffix
+# (plus any directional or unit tokens that follow the suffix)
+_STREET_SUFFIXES = (
+    'st|street|ave|avenue|rd|road|blvd|boulevard|dr|drive|ln|lane|way|hwy|highway|'
+    'pkwy|parkway|ct|court|pl|place|plaza|sq|square|ter|terrace|cir|circle|trl|trail|'
+    'tpke|turnpike|pike|ctr|center|row|walk|loop|alley|aly|broadway|mall'
+)
+_UNIT = r'(?:suite|ste\.?|unit|apt\.?|#)\s*\S+'
+_AFTER_SUFFIX = r'\b(?:' + _STREET_SUFFIXES + r')\.?(?:\s+(?:[NSEW]{1,2}\.?|' + _UNIT + r'|\S*\d\S*))*'
+_CITY_AFTER_STREET = re.compile(r'^.*' + _AFTER_SUFFIX + r'\s+(?P<city>[^\d,#]+?)\s*$', re.I)
+# A St./Ste./Saint straight after the street's own suffix starts the city
+# ("5 Pine Rd St. Louis"), rather than being the suffix itself
+_SAINT_CITY_AFTER_STREET = re.compile(
+    _AFTER_SUFFIX + r'\s+(?P<city>(?:st|ste|saint)\.?\s+[^\d,#]+?)\s*$', re.I)
+# Without a suffix, a number past the house number ends the street ("9 Route 66 Santa Fe",
+# "151 South 500 East Salt Lake City"); after only the house number the street
+# name is still in the run ("1924 N Damen Chicago")
+_AFTER_INNER_NUMBER = re.compile(
+    r'^\S+\s+(?:.*\s)?\S*\d\S*(?:\s+(?:north|south|east|west|[NSEW]{1,2}\.?|' + _UNIT + r'))*'
+    r'\s+(?P<city>[^\d,#]+?)\s*$',
+    re.I,
+)
+_LAST_WORD = re.compile(r'(?P<city>[^\s,]+)\s*$')
+# Only with a unit id after it, so "Ste. Genevieve" keeps its Ste.
+_UNIT_PREFIX = re.compile(r'^(?:suite|ste\.?|unit|apt\.?|#)\s*(?:\S*\d\S*|[A-Z])\s+', re.I)
+
+
+def _clean(addresses):
+    cleaned = addresses.fillna('').astype(str)
+    cleaned = cleaned.str.replace(_TAGS, ', ', regex=True)
+    cleaned = cleaned.str.replace(_COUNTRY, '', regex=True)
+    return cleaned.str.replace(_SPACES, ' ', regex=True).str.strip(' ,')
+
+
+def _parse_unique(addresses):
+    parts = _clean(addresses).str.extract(_STATE_ZIP)
+    head = parts['head'].fillna('')
+
+    has_comma = head.str.contains(',', regex=False)
+    city = head.str.extract(_LAST_SEGMENT)['segment']
+    with_street = city.str.contains(r'\d', regex=True)
+    street = city[with_street]
+    saint = street.str.extract(_SAINT_CITY_AFTER_STREET)['city']
+    city[with_street] = saint.fillna(street.str.extract(_CITY_AFTER_STREET)['city'])
+
+    # No street suffix to anchor on: after a comma the city follows the last
+    # number, as it does after a route or unit number; otherwise the best guess
+    # is the last word
+    missing = city.isna() & has_comma
+    city[missing] = head[missing].str.extract(_AFTER_LAST_NUMBER)['city']
+    missing = city.isna()
+    city[missing] = head[missing].str.extract(_AFTER_INNER_NUMBER)['city']
+    missing = city.isna()
+    city[missing] = head[missing].str.extract(_LAST_WORD)['city']
+
+    city = city.fillna('').str.replace(_UNIT_PREFIX, '', regex=True).str.strip(' ,.')
+    # Handle cases where city might be all caps
+    upper = city.str.isupper()
+    city[upper] = city[upper].str.title()
+
+    matched = parts['state'].notna()
+    return pd.DataFrame({
+        'city': city.where(matched, ''),
+        'state': parts['state'].replace(STATE_CODES).str.upper().fillna(''),
+        'postal_code': parts['zip'].fillna(''),
+    }, index=addresses.index)
+
+
+def parse_addresses(addresses):
+    """
+    Splits a column of full US addresses into city, state and postal_code columns.
+    Each distinct address is parsed once, and rows that don't end in
+    'ST 12345' get empty strings.
+    """
+    addresses = pd.Series(addresses)
+    if addresses.empty:
+        return pd.DataFrame(columns=['city', 'state', 'postal_code'], index=addresses.index)
+    keys = addresses.fillna('').astype(str)
+    unique = pd.Series(keys.unique())
+    parsed = _parse_unique(unique).set_axis(unique.values)
+    return parsed.reindex(keys.values).set_axis(addresses.index)
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from mock_servers import MockUpstream, synthetic_places
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Metrics where a larger value is a regression
+LOWER_IS_BETTER = ('peak_rss_mb',)
+
+
+def _script(name):
+    return os.path.join(REPO_DIR, name)
+
+
+def _pipelines(args, base_url):
+    """name -> (command, mock endpoint whose requests are counted, output file)."""
+    python = sys.executable
+    rate = ['--rate', str(args.rate), '--max-rate', str(args.rate * 4)]
+    return {
+        'stockist': ([python, _script('store.py'), '--input', 'uscities.xlsx', '--output', 'output.xlsx', '--no-cache',
+                      '--concurrency', str(args.concurrency)] + rate, 'stockist', 'output.xlsx'),
+        'khall': ([python, _script('newstore.py'), '--input', 'uscities.xlsx', '--output', 'khall_locations.xlsx',
+                   '--no-cache'] + rate, 'khall', 'khall_locations.xlsx'),
+        'spa': ([python, _script('new2store.py'), '--mode', 'direct',
+                 '--dataset-url', base_url + '/storemapper/stores.json'], 'storemapper', 'spa_locations.xlsx'),
+        'spa-browser': ([python, _script('new2store.py'), '--mode', 'browser'], 'storemapper', 'spa_locations.xlsx'),
+        'serp': ([python, _script('PhoneNumberFinder.py'), '--workers', str(max(1, args.concurrency // 2)),
+                  '--headless', '--http-rate', str(args.rate)], 'search', 'stores_with_info.xlsx'),
+    }
+
+
+def _prepare_workdir(path, cities, stores, serp_rows, seed):
+    """Writes the inputs every pipeline reads from its working directory."""
+    pd.DataFrame(cities).to_excel(os.path.join(path, 'uscities.xlsx'), index=False)
+    sample = random.Random(seed).sample(stores, min(serp_rows, len(stores)))
+    pd.DataFrame({
+        'Store Name': [store['name'] for store in sample],
+        'Address': [store['street'] for store in sample],
+        'City': [store['city'] for store in sample],
+        'State': [store['state'] for store in sample],
+        'PostalCode': [store['postal_code'] for store in sample],
+    }).to_excel(os.path.join(path, 'stores.xlsx'), index=False)
+
+
+def run_pipeline(name, command, endpoint, output_file, upstream, base_url, workdir, verbose=False):
+    """Runs one pipeline as a child process against the mock and returns its measurements."""
+    env = dict(os.environ,
+               STOCKIST_BASE_URL=base_url,
+               KHALL_BASE_URL=base_url,
+               GOOGLE_SEARCH_URL=base_url + '/search',
+               SPA_FINDER_URL=base_url + '/pages/find-a-spa',
+               STORE_FINDER_CACHE=os.path.join(workdir, 'responses.sqlite'))
+    report_file = os.path.join(workdir, f"{name}.report.json")
+    requests_before = upstream.requests[endpoint]
+    start = time.perf_counter()
+    log_file = os.path.join(workdir, f"{name}.log")
+    with open(log_file, 'w') as log:
+        process = subprocess.Popen(command + ['--report', report_file], cwd=workdir, env=env,
+                                   stdout=None if verbose else log, stderr=subprocess.STDOUT)
+        # wait4 gives this child's own peak RSS (kilobytes on Linux)
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        with open(log_file, encoding='utf-8', errors='replace') as log:
+            print(f"{name} failed with exit code {process.returncode}\n{log.read()[-2000:]}")
+        return {'pipeline': name, 'failed': True, 'exit_code': process.returncode}
+
+    output_path = os.path.join(workdir, output_file)
+    rows = len(pd.read_excel(output_path)) if os.path.exists(output_path) else 0
+    served = upstream.requests[endpoint] - requests_before
+    result = {
+        'pipeline': name,
+        'elapsed_s': elapsed,
+        'rows': rows,
+        'rows_per_s': rows / elapsed,
+        'requests': served,
+        'requests_per_s': served / elapsed,
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+    }
+    if os.path.exists(report_file):
+        with open(report_file) as f:
+            report = json.load(f)
+        result['stages'] = {stage: round(s['total_s'], 3) for stage, s in report['stages'].items()}
+        result['client_latency'] = report['requests']
+        result['errors'] = report['errors']
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Names every metric that got worse than `baseline` by more than `tolerance` (a fraction)."""
+    previous = {r['pipeline']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['pipeline'])
+        if not before or result.get('failed') or before.get('failed'):
+            continue
+        for metric in ('rows_per_s', 'requests_per_s', 'peak_rss_mb'):
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if metric in LOWER_IS_BETTER else (change < -tolerance):
+                regressions.append(f"{result['pipeline']} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers end to end against local mock servers.")
+    parser.add_argument('--pipelines', nargs='+', default=['stockist', 'khall', 'spa', 'serp'],
+                        choices=['stockist', 'khall', 'spa', 'spa-browser', 'serp'],
+                        help="spa-browser drives Chrome and is left out by default")
+    parser.add_argument('--cities', type=int, default=200, help="Query points in the generated city list")
+    parser.add_argument('--stores', type=int, default=5000, help="Stores the mock servers know about")
+    parser.add_argument('--serp-rows', type=int, default=200, help="Rows in the generated stores.xlsx for PhoneNumberFinder")
+    parser.add_argument('--latency', type=float, default=0.02, help="Mean seconds per mock API response")
+    parser.add_argument('--rate-limit', type=float, help="Mock API requests per second before it answers 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of mock API requests answered with 503")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=200.0, help="Starting client request rate passed to each scraper")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help="Earlier bench_results.json to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed fractional slowdown before failing")
+    parser.add_argument('--keep-workdir', action='store_true', help="Leave the working directory with every output in place")
+    parser.add_argument('--verbose', action='store_true', help="Show the scrapers' own output")
+    args = parser.parse_args()
+
+    cities, stores = synthetic_places(args.cities, args.stores, args.seed)
+    upstream = MockUpstream(stores, args.latency, args.rate_limit, args.error_rate, seed=args.seed)
+    server = upstream.serve()
+    pipelines = _pipelines(args, server.base_url)
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='store-finder-bench-')
+    try:
+        for name in args.pipelines:
+            command, endpoint, output_file = pipelines[name]
+            pipeline_dir = os.path.join(workdir, name)
+            os.makedirs(pipeline_dir)
+            _prepare_workdir(pipeline_dir, cities, stores, args.serp_rows, args.seed)
+            print(f"Running {name}...")
+            result = run_pipeline(name, command, endpoint, output_file, upstream, server.base_url, pipeline_dir, args.verbose)
+            results.append(result)
+            if not result.get('failed'):
+                print(f"  {result['rows']} rows in {result['elapsed_s']:.2f}s: {result['rows_per_s']:.1f} rows/s, "
+                      f"{result['requests_per_s']:.1f} req/s, peak {result['peak_rss_mb']:.0f} MB")
+    finally:
+        server.shutdown()
+        if args.keep_workdir:
+            print(f"Outputs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'keep_workdir', 'verbose')},
+        'mock': {'throttled': dict(upstream.throttled), 'errors': dict(upstream.errors)},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = [r['pipeline'] for r in results if r.get('failed')]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+from metrics import get_metrics
+
+
+class BrowserPool:
+    """
+    Runs lookups on N long-lived WebDriver instances fed from a shared queue.
+    A driver that crashes or stops responding (any WebDriverException, including
+    page-load timeouts) is quit and replaced, and its task is retried; any other
+    error is retried too, and a task that keeps failing maps to `default`.
+    """
+
+    def __init__(self, make_driver, workers=4, page_load_timeout=30, max_retries=2, delay=0.0):
+        self.make_driver = make_driver
+        self.workers = workers
+        self.page_load_timeout = page_load_timeout
+        self.max_retries = max_retries
+        self.delay = delay
+        self.restarts = 0
+        self._lock = threading.Lock()
+
+    def _start_driver(self):
+        driver = self.make_driver()
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return driver
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def run(self, tasks, lookup, default=None, on_result=None):
+        """
+        Calls lookup(driver, *args) for every (key, args) in `tasks` and returns
+        {key: result}. Tasks that still fail after max_retries map to `default`.
+        on_result(key, result) is called from the worker thread as each finishes.
+        """
+        pending = queue.Queue()
+        for key, args in tasks:
+            pending.put((key, args, 0))
+        results = {}
+
+        def worker():
+            driver = None
+            while True:
+                try:
+                    key, args, attempt = pending.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if driver is None:
+                        driver = self._start_driver()
+                    result = lookup(driver, *args)
+                except Exception as e:
+                    # Not just crashed browsers: a driver that can't start or a bug in lookup
+                    # must not end the thread and strand the tasks still queued behind it
+                    get_metrics().record_error(e)
+                    if isinstance(e, WebDriverException):
+                        print(f"[!] Browser failed on {key} (attempt {attempt + 1}): {e.__class__.__name__}; restarting it")
+                        self._quit(driver)
+                        driver = None
+                        with self._lock:
+                            self.restarts += 1
+                    else:
+                        print(f"[!] Lookup failed on {key} (attempt {attempt + 1}): {e!r}")
+                    if attempt < self.max_retries:
+                        pending.put((key, args, attempt + 1))
+                        continue
+                    result = default
+                with self._lock:
+                    results[key] = result
+                if on_result:
+                    on_result(key, result)
+                if self.delay:
+                    time.sleep(self.delay)
+            if driver is not None:
+                self._quit(driver)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, self.workers))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import get_metrics
+
+DEFAULT_CACHE_PATH = os.environ.get('STORE_FINDER_CACHE', 'responses.sqlite')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# How long a cached response stays fresh, in seconds
+PROVIDER_TTLS = {
+    'stockist': 7 * 24 * 3600,
+    'khall': 7 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+
+def normalize_params(params):
+    """Canonical form of request parameters so equivalent requests share a key."""
+    normalized = {}
+    for name, value in (params or {}).items():
+        if isinstance(value, float):
+            value = round(value, 6)
+        elif hasattr(value, 'item'):  # numpy scalars from pandas rows
+            value = value.item()
+            if isinstance(value, float):
+                value = round(value, 6)
+        elif isinstance(value, str):
+            value = value.strip()
+        normalized[str(name)] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+def cache_key(provider, endpoint, params):
+    raw = f"{provider}\n{endpoint}\n{normalize_params(params)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Single-file SQLite cache of raw response bodies, shared by all scrapers."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttls = dict(PROVIDER_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        # Running total of body sizes, so a put doesn't sum the whole table
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _fresh(self, provider, created, now):
+        return now - created <= self.ttls.get(provider, DEFAULT_TTL)
+
+    def has(self, provider, endpoint, params):
+        """True when get() would return a body, without touching the entry."""
+        if not self.enabled:
+            return False
+        key = cache_key(provider, endpoint, params)
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and self._fresh(provider, row[0], time.time())
+
+    def get(self, provider, endpoint, params):
+        """Returns the cached body, or None when missing or older than the provider's TTL."""
+        if not self.enabled:
+            return None
+        key = cache_key(provider, endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            body, created = row
+            if not self._fresh(provider, created, now):
+                self._bytes -= self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()[0]
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return body
+
+    def put(self, provider, endpoint, params, body):
+        if not self.enabled:
+            return
+        now = time.time()
+        size = len(body.encode('utf-8'))
+        key = cache_key(provider, endpoint, params)
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, endpoint, normalize_params(params), body, size, now, now))
+            self._bytes += size - (replaced[0] if replaced else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        if self._bytes <= self.max_bytes:
+            return
+        while self._bytes > self.max_bytes:
+            # A few of the oldest at a time, via the accessed index, rather than listing the table
+            oldest = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 32").fetchall()
+            if not oldest:
+                self._bytes = 0
+                break
+            for key, size in oldest:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= size
+                if self._bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        """Entry count and bytes per provider/endpoint."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT provider, endpoint, COUNT(*), SUM(size), MIN(created), MAX(created)
+                FROM responses GROUP BY provider, endpoint ORDER BY provider, endpoint
+            """).fetchall()
+        return [
+            {'provider': p, 'endpoint': e, 'entries': n, 'bytes': b, 'oldest': lo, 'newest': hi}
+            for p, e, n, b, lo, hi in rows
+        ]
+
+    def entries(self, provider=None, limit=20):
+        query = "SELECT provider, endpoint, params, size, created FROM responses"
+        args = ()
+        if provider:
+            query += " WHERE provider = ?"
+            args = (provider,)
+        query += " ORDER BY created DESC LIMIT ?"
+        with self._lock:
+            return self._conn.execute(query, args + (limit,)).fetchall()
+
+    def purge(self, provider=None, older_than=None, expired=False):
+        """Deletes entries matching the filters (all entries if none are given). Returns the count."""
+        clauses, args = [], []
+        if provider:
+            clauses.append("provider = ?")
+            args.append(provider)
+        if older_than is not None:
+            clauses.append("created < ?")
+            args.append(time.time() - older_than)
+        query = "DELETE FROM responses" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            if expired:
+                removed = 0
+                for name in {p for (p,) in self._conn.execute("SELECT DISTINCT provider FROM responses")}:
+                    cutoff = time.time() - self.ttls.get(name, DEFAULT_TTL)
+                    removed += self._conn.execute(
+                        "DELETE FROM responses WHERE provider = ? AND created < ?", (name, cutoff)).rowcount
+            else:
+                removed = self._conn.execute(query, args).rowcount
+            self._conn.commit()
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return removed
+
+
+_shared_cache = None
+
+
+def get_cache():
+    """The process-wide cache used by the scrapers."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ResponseCache()
+    return _shared_cache
+
+
+def cached_json(provider, endpoint, params, fetch):
+    """
+    Returns the decoded JSON for a request, calling fetch() for the response text
+    only on a cache miss. Bodies are cached only once they decode cleanly.
+    """
+    cache = get_cache()
+    body = cache.get(provider, endpoint, params)
+    if body is not None:
+        get_metrics().count('cache_hits')
+        return json.loads(body)
+    get_metrics().count('cache_misses')
+    body = fetch()
+    data = json.loads(body)
+    cache.put(provider, endpoint, params, body)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge the scraper response cache.")
+    parser.add_argument('--path', default=DEFAULT_CACHE_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help="Entries and size per provider/endpoint")
+    show = sub.add_parser('show', help="List the most recent entries")
+    show.add_argument('--provider')
+    show.add_argument('--limit', type=int, default=20)
+    purge = sub.add_parser('purge', help="Delete entries")
+    purge.add_argument('--provider')
+    purge.add_argument('--older-than-hours', type=float)
+    purge.add_argument('--expired', action='store_true', help="Only entries past their provider's TTL")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path)
+    if args.command == 'stats':
+        for row in cache.stats():
+            print(f"{row['provider']:10} {row['endpoint']:50} {row['entries']:8} entries {row['bytes'] / 1024:10.1f} KiB "
+                  f"oldest {time.ctime(row['oldest'])}")
+    elif args.command == 'show':
+        for provider, endpoint, params, size, created in cache.entries(args.provider, args.limit):
+            print(f"{time.ctime(created)}  {provider}  {endpoint}  {params}  ({size} bytes)")
+    elif args.command == 'purge':
+        older_than = args.older_than_hours * 3600 if args.older_than_hours is not None else None
+        removed = cache.purge(args.provider, older_than, args.expired)
+        print(f"Removed {removed} cached responses")
+
+
+if __name__ == "__main__":
+    main()
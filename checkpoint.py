@@ -0,0 +1,112 @@
+import json
+import os
+
+
+def point_key(point):
+    return tuple(round(float(v), 6) for v in point)
+
+
+def _json_default(value):
+    # numpy scalars coming out of pandas rows
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _drop_torn_tail(path, block=1 << 16):
+    """Cuts a journal back to its last complete line, so the next entry starts on a fresh one."""
+    with open(path, 'rb+') as f:
+        size = end = f.seek(0, os.SEEK_END)
+        # Scan back from the end a block at a time for the last newline
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+            print(f"Dropped {size - end} bytes of a half-written entry at the end of {path}")
+
+
+def _read_entries(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; that point gets fetched again
+                continue
+
+
+def read_journal(path):
+    """({point key: row count}, rows) from a journal, without opening it for writing."""
+    completed, rows = {}, []
+    for entry in _read_entries(path):
+        completed[point_key(entry['point'])] = len(entry['rows'])
+        rows.extend(entry['rows'])
+    return completed, rows
+
+
+def journal_entries(path):
+    """(point, rows) for each point recorded in a journal, in the order written."""
+    for entry in _read_entries(path):
+        yield tuple(entry['point']), entry['rows']
+
+
+class Checkpoint:
+    """
+    Append-only JSONL journal of finished query points. Each line holds one point
+    and the rows it produced, written and flushed as soon as the point completes,
+    so a crashed or interrupted sweep can resume with only the remaining points.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        # point key -> number of rows it produced
+        self.completed = {}
+        if resume and os.path.exists(path):
+            _drop_torn_tail(path)
+            for entry in self._entries():
+                self.completed[point_key(entry['point'])] = len(entry['rows'])
+            print(f"Resuming from {path}: {len(self.completed)} query points already done")
+        elif os.path.exists(path):
+            os.remove(path)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _entries(self):
+        return _read_entries(self.path)
+
+    def is_done(self, point):
+        return point_key(point) in self.completed
+
+    def row_count(self, point):
+        return self.completed[point_key(point)]
+
+    def pending(self, points):
+        return [p for p in points if not self.is_done(p)]
+
+    def record(self, point, rows):
+        entry = {'point': [float(v) for v in point], 'rows': rows}
+        self._file.write(json.dumps(entry, default=_json_default) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.completed[point_key(point)] = len(rows)
+
+    def rows(self):
+        """Every row recorded so far, including those from earlier runs."""
+        if not self._file.closed:
+            self._file.flush()
+        for entry in self._entries():
+            yield from entry['rows']
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
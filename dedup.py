@@ -0,0 +1,100 @@
+import hashlib
+import html
+import re
+
+_TAGS = re.compile(r'<[^>]+>')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def normalize(value):
+    """Lowercase words of a field with HTML tags, entities and punctuation stripped."""
+    if value is None or value != value:  # None or NaN
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # postal codes read back from Excel as 11216.0
+    text = html.unescape(_TAGS.sub(' ', str(value))).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def parse_distance(value):
+    """Numeric distance from 46, '46' or '1.2 Miles'; None when there isn't one."""
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)
+    match = _NUMBER.search(str(value or ''))
+    return float(match.group()) if match else None
+
+
+def store_key(row):
+    """
+    Identity of a store row: the provider id when there is one, otherwise the
+    normalized name, street address and postal code.
+    """
+    store_id = row.get('id')
+    if store_id not in (None, '') and store_id == store_id:
+        raw = f"id:{store_id}"
+    else:
+        address = row.get('address') or ' '.join(
+            str(row.get(f) or '') for f in ('address_line_1', 'address_line_2', 'city', 'state'))
+        raw = '|'.join((normalize(row.get('name')), normalize(address), normalize(row.get('postal_code'))))
+    # 8-byte digests keep the index small: a few million stores fit in well under a gigabyte
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).digest()
+
+
+class DedupIndex:
+    """Remembers which stores have been seen, and the smallest distance reported for each."""
+
+    def __init__(self):
+        self._min_distance = {}
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._min_distance)
+
+    def add(self, row, key=None):
+        """Records a row (whose store_key may be passed in); returns True the first time its store is seen."""
+        key = store_key(row) if key is None else key
+        distance = parse_distance(row.get('distance'))
+        if key in self._min_distance:
+            self.duplicates += 1
+            seen = self._min_distance[key]
+            if distance is not None and (seen is None or distance < seen):
+                self._min_distance[key] = distance
+            return False
+        self._min_distance[key] = distance
+        return True
+
+    def min_distance(self, key):
+        return self._min_distance.get(key)
+
+
+def _with_distance(current, best):
+    if isinstance(current, str):
+        # Keep the provider's formatting, e.g. '1.2 Miles'
+        return _NUMBER.sub(f"{best:g}", current, count=1)
+    return best
+
+
+def dedupe_into(rows, buffer):
+    """
+    Drops duplicate stores from an iterable of rows into a rowbuffer.RowBuffer,
+    keeping the first row seen for each store with the minimum distance reported
+    across its duplicates.
+    """
+    index = DedupIndex()
+    # Keys of the kept rows, by buffer position: a row read back from the buffer
+    # has been encoded (e.g. an empty int id becomes None) and may not rebuild the same key
+    start, keys = len(buffer), []
+    for row in rows:
+        key = store_key(row)
+        if index.add(row, key):
+            buffer.append(row)
+            keys.append(key)
+    if 'distance' in buffer.schema:
+        for i, key in enumerate(keys, start):
+            best = index.min_distance(key)
+            if best is not None:
+                buffer.set(i, 'distance', _with_distance(buffer.get(i, 'distance'), best))
+    if index.duplicates:
+        print(f"Dropped {index.duplicates} duplicate rows, {len(buffer)} unique stores remain")
+    return buffer
@@ -0,0 +1,133 @@
+import difflib
+import os
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+from dedup import normalize
+
+# Collected outputs that may already hold a store's phone/website
+DEFAULT_SOURCES = ['stores_with_info.xlsx', 'output.xlsx', 'khall_locations.xlsx', 'store_results.xlsx']
+
+# Street words spelled out in one source and abbreviated in another
+STREET_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr', 'lane': 'ln',
+    'place': 'pl', 'court': 'ct', 'highway': 'hwy', 'parkway': 'pkwy', 'suite': 'ste', 'north': 'n',
+    'south': 's', 'east': 'e', 'west': 'w', 'first': '1st', 'second': '2nd', 'third': '3rd',
+}
+
+_BREAK = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_ZIP = re.compile(r'\d{5}')
+_HOUSE_NUMBER = re.compile(r'^(\d+)\b')
+
+
+def normalize_street(value):
+    words = normalize(value).split()
+    return ' '.join(STREET_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _zip(value):
+    if isinstance(value, float) and value == value and value.is_integer():
+        value = int(value)
+    match = _ZIP.search(str(value or ''))
+    return match.group() if match else ''
+
+
+def _text(value):
+    if value is None or value != value:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _known_rows(path):
+    """(name, street, city, state, postal_code, phone, website, closed) for each row of a collected output."""
+    df = pd.read_excel(path, dtype=str)
+    empty = [None] * len(df)
+    if 'Store Name' in df.columns:
+        # An earlier PhoneNumberFinder run
+        return zip(df['Store Name'], df['Address'], df['City'], df['State'], df['PostalCode'],
+                   df.get('Phone Number', empty), df.get('Website', empty), df.get('Closed', empty))
+    if 'address_line_1' in df.columns:
+        street = df['address_line_1']
+    elif 'address' in df.columns:
+        # khall addresses are '<street><br />\n\n<city>, <state> <zip>'
+        street = df['address'].map(lambda a: _BREAK.split(a)[0] if isinstance(a, str) else a)
+    else:
+        return []
+    return zip(df['name'], street, df.get('city', empty), df.get('state', empty), df.get('postal_code', empty),
+               df.get('phone', empty), df.get('website', empty), empty)
+
+
+class KnownStores:
+    """
+    Phone numbers and websites already collected for stores, looked up by
+    fuzzy name + street match within the same postal code (or city and state).
+    """
+
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self._by_zip = defaultdict(list)
+        self._by_city = defaultdict(list)
+        self._seen = set()
+        self.size = 0
+
+    def add(self, name, street, city, state, postal_code, phone=None, website=None, closed=None):
+        phone, website = _text(phone), _text(website)
+        if not (phone or website):
+            return
+        entry = (normalize(name), normalize_street(street), phone, website, str(closed).lower() == 'true')
+        zip_code = _zip(postal_code)
+        # Sweep outputs repeat a store once per query point that found it
+        if (entry[:2], zip_code) in self._seen:
+            return
+        self._seen.add((entry[:2], zip_code))
+        if zip_code:
+            self._by_zip[zip_code].append(entry)
+        self._by_city[(normalize(city), normalize(state))].append(entry)
+        self.size += 1
+
+    def load(self, path):
+        before = self.size
+        for row in _known_rows(path):
+            self.add(*row)
+        print(f"Loaded {self.size - before} known stores with a phone or website from {path}")
+
+    def _score(self, name, street, entry):
+        known_name, known_street = entry[0], entry[1]
+        number, known_number = _HOUSE_NUMBER.match(street), _HOUSE_NUMBER.match(known_street)
+        if number and known_number and number.group(1) != known_number.group(1):
+            return 0.0  # Same name at another address is a different branch
+        name_score = difflib.SequenceMatcher(None, name, known_name).ratio()
+        if not street or not known_street:
+            return name_score
+        street_score = difflib.SequenceMatcher(None, street, known_street).ratio()
+        return 0.6 * name_score + 0.4 * street_score
+
+    def match(self, name, street, city, state, postal_code):
+        """(phone, website, is_closed) of the best match scoring at least `threshold`, or None."""
+        name, street = normalize(name), normalize_street(street)
+        if not name:
+            return None
+        candidates = self._by_zip.get(_zip(postal_code)) or self._by_city.get((normalize(city), normalize(state)), ())
+        best, best_score = None, self.threshold
+        for entry in candidates:
+            if entry[0] == name and entry[1] == street:
+                return entry[2:]
+            # Cheap upper bound first; most candidates in a postal code are different stores
+            if difflib.SequenceMatcher(None, name, entry[0]).quick_ratio() < (best_score - 0.4) / 0.6:
+                continue
+            score = self._score(name, street, entry)
+            # Ties keep the earlier source, so past lookups win over sweep outputs
+            if score > best_score or (best is None and score >= best_score):
+                best, best_score = entry, score
+        return best[2:] if best else None
+
+
+def load_known_stores(paths, threshold=0.85):
+    known = KnownStores(threshold)
+    for path in paths:
+        if os.path.exists(path):
+            known.load(path)
+    return known
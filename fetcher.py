@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from metrics import get_metrics
+
+
+class HostRateBudget:
+    """Spaces out request starts so a host never sees more than `rate` requests per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = {}
+        self._locks = {}
+
+    async def acquire(self, host):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _fetch_all(points, fetch, host, concurrency, rate, on_result, cached):
+    semaphore = asyncio.Semaphore(concurrency)
+    # A fixed requests/second budget, or an adaptive controller with the same acquire()
+    budget = rate if hasattr(rate, 'acquire') else HostRateBudget(rate)
+    results = [None] * len(points)
+
+    async def worker(i, point):
+        async with semaphore:
+            # Responses the cache already holds never reach the host, so they don't wait for a slot
+            if not (cached and cached(*point)):
+                with get_metrics().stage('rate_wait'):
+                    await budget.acquire(host)
+            # fetch() is a blocking requests call, so it runs on a worker thread
+            try:
+                result = await asyncio.to_thread(fetch, *point)
+            except Exception as e:
+                # One unexpected error fails its point, not the whole sweep
+                get_metrics().record_error(e)
+                print(f"Fetch failed for {point}: {e!r}")
+                result = None
+        results[i] = result
+        if on_result:
+            on_result(point, result)
+
+    await asyncio.gather(*(worker(i, point) for i, point in enumerate(points)))
+    return results
+
+
+def fetch_all(points, fetch, host, concurrency=8, rate=2.0, on_result=None, cached=None):
+    """
+    Calls fetch(*point) for every point with at most `concurrency` calls in flight
+    and at most `rate` calls per second started against `host`. `rate` may also
+    be a ratecontrol.AimdRateController that adapts the pace as responses arrive.
+    Returns the results in the same order as `points`, with None for a point
+    whose fetch raised; on_result(point, result) is called as each one completes.
+    Points for which cached(*point) is true skip the rate limit.
+    """
+    points = list(points)
+    if not points:
+        return []
+    return asyncio.run(_fetch_all(points, fetch, host, concurrency, rate, on_result, cached))
@@ -0,0 +1,127 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import get_metrics
+from ratecontrol import parse_retry_after
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def _retry_policy(retries, backoff):
+    options = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        # The locator endpoints are read-only searches, so POSTs are safe to repeat too
+        allowed_methods=frozenset({'GET', 'POST'}),
+        respect_retry_after_header=True,
+    )
+    try:
+        return Retry(backoff_jitter=backoff, **options)
+    except TypeError:  # urllib3 < 2 has no jitter option
+        return Retry(**options)
+
+
+class HttpClient:
+    """
+    Keep-alive session with a connection pool sized for the fetch engine,
+    retries with jittered exponential backoff on connection errors and 5xx,
+    and optional hedging: if a request hasn't answered after `hedge_after`
+    seconds a duplicate is sent and whichever finishes first wins.
+    Every response, including 429/5xx that urllib3 retried internally, is
+    recorded in the run metrics and fed back to a ratecontrol.AimdRateController.
+    """
+
+    def __init__(self, provider='http', pool_size=16, retries=3, backoff=0.5, hedge_after=None, headers=None,
+                 rate_controller=None):
+        self.provider = provider
+        self.hedge_after = hedge_after
+        self.rate_controller = rate_controller
+        self.hedged = 0
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                              max_retries=_retry_policy(retries, backoff))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * 2) if hedge_after else None
+
+    def _send(self, method, url, **kwargs):
+        controller = self.rate_controller
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            get_metrics().record_request(self.provider, time.monotonic() - start, error=e)
+            if controller:
+                controller.record(None)
+            raise
+        metrics = get_metrics()
+        metrics.record_request(self.provider, time.monotonic() - start, response.status_code)
+        retries = getattr(response.raw, 'retries', None)
+        history = retries.history if retries else ()
+        # Throttled and failed attempts urllib3 retried internally never surface as the final status
+        for attempt in history:
+            metrics.record_retry(self.provider, attempt.status)
+        if controller:
+            for attempt in history:
+                controller.record(attempt.status)
+            # Latency is only meaningful when no retry backoff is folded into it
+            latency = None if history else time.monotonic() - start
+            controller.record(response.status_code, latency, parse_retry_after(response.headers.get('Retry-After')))
+        return response
+
+    def request(self, method, url, **kwargs):
+        if not self._executor:
+            return self._send(method, url, **kwargs)
+
+        primary = self._executor.submit(self._send, method, url, **kwargs)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.hedged += 1
+        hedge = self._executor.submit(self._send, method, url, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def configure_client(provider, **options):
+    """Replaces the shared client for a provider, e.g. to turn on hedging."""
+    with _clients_lock:
+        _clients[provider] = HttpClient(provider, **options)
+        return _clients[provider]
+
+
+def get_client(provider, **options):
+    """The shared client for a provider, created with `options` on first use."""
+    with _clients_lock:
+        if provider not in _clients:
+            _clients[provider] = HttpClient(provider, **options)
+        return _clients[provider]
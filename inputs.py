@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.input_cache'
+
+# Canonical column name -> spellings used across the city spreadsheets, preferred first
+COLUMN_ALIASES = {
+    'latitude': ['latitude', 'lat'],
+    'longitude': ['longitude', 'lng', 'lon'],
+    'city': ['City', 'city'],
+    'state': ['state_id', 'state_name', 'state'],
+}
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _has_parquet():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _sidecar_paths(path):
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    base = os.path.join(folder, os.path.basename(path))
+    # Without pyarrow, one .npy file per column in a directory: still columnar, and memory-mapped on read
+    data = base + ('.parquet' if _has_parquet() else '.columns')
+    return folder, data, base + '.meta.json'
+
+
+def _read_spreadsheet(path):
+    """Reads only the recognized columns and renames them to their canonical names."""
+    wanted = {alias for aliases in COLUMN_ALIASES.values() for alias in aliases}
+    df = pd.read_excel(path, usecols=lambda c: c in wanted)
+    renamed = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        # The earliest spelling in COLUMN_ALIASES wins, e.g. state_id over state_name
+        present = [alias for alias in aliases if alias in df.columns]
+        if present:
+            renamed[present[0]] = name
+    return df[list(renamed)].rename(columns=renamed)
+
+
+def _write_columns(df, folder):
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    for name in df.columns:
+        column = df[name]
+        if pd.api.types.is_numeric_dtype(column):
+            values = column.to_numpy(dtype=np.float64)
+        else:
+            # Fixed-width text rather than Python objects, so the file can be memory-mapped; '' is a blank cell
+            values = column.fillna('').astype(str).to_numpy(dtype=str)
+        np.save(os.path.join(folder, name + '.npy'), values)
+
+
+def _read_columns(folder, columns):
+    data = {}
+    for name in columns:
+        file = os.path.join(folder, name + '.npy')
+        if not os.path.exists(file):
+            continue
+        values = np.load(file, mmap_mode='r')
+        data[name] = values if values.dtype.kind == 'f' else pd.Series(values).replace('', None).to_numpy()
+    return pd.DataFrame(data, copy=False)
+
+
+def _write_meta(path, meta_path, sha1=None):
+    stat = os.stat(path)
+    with open(meta_path, 'w') as f:
+        json.dump({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': sha1 or _file_hash(path)}, f)
+
+
+def _source_is_unchanged(path, meta_path):
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(path)
+    if meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size:
+        return True
+    if meta.get('size') == stat.st_size and meta.get('sha1') == _file_hash(path):
+        # Touched but not edited: keep the sidecar and refresh the stamp
+        _write_meta(path, meta_path, meta['sha1'])
+        return True
+    return False
+
+
+def load_cities(path, columns=('latitude', 'longitude')):
+    """
+    Returns the requested canonical columns from a city spreadsheet. The first read
+    converts the spreadsheet into a columnar sidecar under .input_cache/ (Parquet
+    with pyarrow, otherwise memory-mapped .npy columns); later reads load only the
+    requested columns from it until the spreadsheet's mtime/size (then content
+    hash) changes.
+    """
+    folder, data_path, meta_path = _sidecar_paths(path)
+    df = None
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        if _source_is_unchanged(path, meta_path):
+            if data_path.endswith('.parquet'):
+                try:
+                    df = pd.read_parquet(data_path, columns=list(columns))
+                except (KeyError, ValueError):
+                    # A requested column the spreadsheet lacks; read it whole for the error below
+                    df = pd.read_parquet(data_path)
+            else:
+                df = _read_columns(data_path, columns)
+
+    if df is None:
+        df = _read_spreadsheet(path)
+        os.makedirs(folder, exist_ok=True)
+        if data_path.endswith('.parquet'):
+            df.to_parquet(data_path, index=False)
+        else:
+            _write_columns(df, data_path)
+        _write_meta(path, meta_path)
+
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        spellings = ', '.join("'" + "'/'".join(COLUMN_ALIASES[c]) + "'" for c in missing)
+        raise ValueError(f"{path} must contain {spellings} columns")
+    return df[list(columns)]
+
+
+def load_points(path):
+    """(lat, lon) pairs from a city spreadsheet, skipping rows without coordinates."""
+    df = load_cities(path).dropna()
+    return list(zip(df['latitude'].tolist(), df['longitude'].tolist()))
@@ -0,0 +1,216 @@
+import json
+import math
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ratecontrol import current_rates
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def classify_error(exc):
+    """Coarse failure type for the error taxonomy."""
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        return 'http_429' if status == 429 else f"http_{status // 100}xx"
+    if isinstance(exc, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(exc, requests.exceptions.RetryError):
+        return 'retries_exhausted'
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return 'connection'
+    if isinstance(exc, ValueError):
+        return 'parse'
+    name = type(exc).__name__
+    if 'Timeout' in name:
+        return 'timeout'
+    if 'WebDriver' in name or type(exc).__module__.startswith('selenium'):
+        return 'webdriver'
+    return 'other'
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = q / 100 * (len(ordered) - 1)
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class RunMetrics:
+    """Per-stage timings, request latencies, counters and failures for one run."""
+
+    def __init__(self, script=None):
+        self.script = script
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: array('d'))
+        self._latencies = defaultdict(lambda: array('d'))
+        # Running Prometheus totals, so a scrape doesn't walk the samples under the lock
+        self._stage_sums = Counter()
+        self._latency_sums = Counter()
+        self._buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self._statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.counters = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Times a block of work, e.g. with metrics.stage('parse'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stages[name].append(elapsed)
+                self._stage_sums[name] += elapsed
+
+    def record_request(self, provider, latency, status=None, error=None):
+        with self._lock:
+            self._latencies[provider].append(latency)
+            self._latency_sums[provider] += latency
+            buckets = self._buckets[provider]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    buckets[i] += 1
+            self._statuses[provider][str(status) if status is not None else 'error'] += 1
+            if error is not None:
+                self.errors[classify_error(error)] += 1
+            elif status is not None and status >= 400:
+                self.errors['http_429' if status == 429 else f"http_{status // 100}xx"] += 1
+
+    def record_retry(self, provider, status=None):
+        """Counts an attempt the HTTP client retried internally (a 429/5xx, or no response at all)."""
+        with self._lock:
+            self._statuses[provider][str(status) if status is not None else 'error'] += 1
+            if status is None:
+                self.errors['connection'] += 1
+            elif status >= 400:
+                self.errors['http_429' if status == 429 else f"http_{status // 100}xx"] += 1
+            self.counters['retried'] += 1
+
+    def record_error(self, kind):
+        """Counts a failure; `kind` is a taxonomy name or an exception."""
+        with self._lock:
+            self.errors[kind if isinstance(kind, str) else classify_error(kind)] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def report(self):
+        """Machine-readable summary of the run so far."""
+        elapsed = time.time() - self.started
+        with self._lock:
+            stages = {
+                name: {'count': len(d), 'total_s': sum(d), 'mean_s': sum(d) / len(d) if d else None,
+                       'p95_s': percentile(d, 95)}
+                for name, d in self._stages.items()
+            }
+            requests_ = {}
+            for provider, d in self._latencies.items():
+                requests_[provider] = {
+                    'count': len(d),
+                    'per_second': len(d) / elapsed if elapsed else None,
+                    'p50_s': percentile(d, 50),
+                    'p95_s': percentile(d, 95),
+                    'p99_s': percentile(d, 99),
+                    'statuses': dict(self._statuses[provider]),
+                }
+            return {
+                'script': self.script,
+                'started': self.started,
+                'elapsed_s': elapsed,
+                'stages': stages,
+                'requests': requests_,
+                'errors': dict(self.errors),
+                'counters': dict(self.counters),
+                'rates': current_rates(),
+            }
+
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Run report written to {path}")
+
+    def prometheus_text(self):
+        lines = [
+            '# TYPE store_finder_stage_seconds summary',
+            '# TYPE store_finder_request_seconds histogram',
+            '# TYPE store_finder_errors_total counter',
+            '# TYPE store_finder_events_total counter',
+            '# TYPE store_finder_rate_limit gauge',
+        ]
+        with self._lock:
+            for name, d in self._stages.items():
+                lines.append(f'store_finder_stage_seconds_sum{{stage="{name}"}} {self._stage_sums[name]}')
+                lines.append(f'store_finder_stage_seconds_count{{stage="{name}"}} {len(d)}')
+            for provider, d in self._latencies.items():
+                for bound, below in zip(LATENCY_BUCKETS, self._buckets[provider]):
+                    lines.append(f'store_finder_request_seconds_bucket{{provider="{provider}",le="{bound}"}} {below}')
+                lines.append(f'store_finder_request_seconds_bucket{{provider="{provider}",le="+Inf"}} {len(d)}')
+                lines.append(f'store_finder_request_seconds_sum{{provider="{provider}"}} {self._latency_sums[provider]}')
+                lines.append(f'store_finder_request_seconds_count{{provider="{provider}"}} {len(d)}')
+            for kind, n in self.errors.items():
+                lines.append(f'store_finder_errors_total{{type="{kind}"}} {n}')
+            for name, n in self.counters.items():
+                lines.append(f'store_finder_events_total{{name="{name}"}} {n}')
+        for provider, rate in current_rates().items():
+            lines.append(f'store_finder_rate_limit{{provider="{provider}"}} {rate}')
+        return '\n'.join(lines) + '\n'
+
+    def serve_prometheus(self, port, host='127.0.0.1'):
+        """Serves /metrics in Prometheus text format from a background thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Prometheus metrics on http://{host}:{server.server_port}/metrics")
+        return server
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics():
+    """The process-wide metrics every stage records into."""
+    return _metrics
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--report', help="Write a JSON run report (timings, latency percentiles, errors) here")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus text metrics on this port while running")
+
+
+def start_run(script, args):
+    """Names the run and starts the Prometheus endpoint if one was asked for."""
+    _metrics.script = script
+    if getattr(args, 'metrics_port', None):
+        _metrics.serve_prometheus(args.metrics_port)
+    return _metrics
+
+
+def finish_run(args):
+    if getattr(args, 'report', None):
+        _metrics.write_report(args.report)
@@ -0,0 +1,320 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from geo import haversine_miles
+from quadtree import CONUS_BOUNDS
+
+STATES = ['AL', 'AZ', 'CA', 'CO', 'FL', 'GA', 'IL', 'MI', 'MN', 'NC', 'NM', 'NY', 'OH', 'OR', 'PA', 'TX', 'UT', 'WA']
+STREETS = ['Main St', 'Oak Ave', 'Terrace St', 'Paseo De Peralta', 'Myrtle Ave', '5th Ave', 'Market St', 'Broadway',
+           'Elm St', 'Lake Rd', 'Highland Dr', 'Tompkins Avenue']
+NAME_WORDS = ['Green', 'Habit', 'Wolf', 'Riot', 'Pandora', 'Cedar', 'Willow', 'Harbor', 'Juniper', 'Sage', 'Copper',
+              'Luna', 'Meadow', 'Salt', 'Bloom', 'Fern']
+NAME_KINDS = ['Boutique', 'Spa', 'Gifts', 'Mercantile', 'Apothecary', 'Salon', 'Resort', 'Goods']
+
+
+def synthetic_places(cities=200, stores=5000, seed=0, bounds=CONUS_BOUNDS):
+    """
+    A reproducible set of cities and stores clustered around them, shaped like
+    what the real locators return. Returns (city_rows, store_rows).
+    """
+    rng = random.Random(seed)
+    south, west, north, east = bounds
+    city_rows = [{'City': f"Bench City {i:04d}", 'state_id': rng.choice(STATES),
+                  'latitude': round(rng.uniform(south, north), 6), 'longitude': round(rng.uniform(west, east), 6)}
+                 for i in range(cities)]
+    store_rows = []
+    for i in range(stores):
+        city = rng.choice(city_rows)
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {rng.choice(NAME_KINDS)} {i}"
+        store_rows.append({
+            'id': 20000000 + i,
+            'name': name.upper() if rng.random() < 0.3 else name,
+            'street': f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+            'city': city['City'],
+            'state': city['state_id'],
+            'postal_code': f"{rng.randint(10000, 99999)}",
+            'phone': f"{rng.randint(201, 989)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+            'website': f"https://store{i}.example.com/" if rng.random() < 0.6 else None,
+            'latitude': city['latitude'] + rng.gauss(0, 0.3),
+            'longitude': city['longitude'] + rng.gauss(0, 0.3),
+        })
+    return city_rows, store_rows
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+SPA_FINDER_PAGE = """<!doctype html>
+<html><head><title>Find a spa</title></head>
+<body>
+<input id="storemapper-zip"> <button id="storemapper-go">Search</button>
+<button id="storemapper-distance-btn">Distance</button>
+<div><input type="radio" id="storemapperRadius-250" name="radius"> 250 mi</div>
+<div id="storemapper-list" style="height: 600px; overflow: auto"></div>
+<button class="strmpr-view-more-stores-button strmpr-hidden">Show More Stores</button>
+<script>
+let stores = [], matches = [], shown = 0;
+fetch('/storemapper/stores.json').then(r => r.json()).then(data => { stores = data.stores; });
+const more = document.querySelector('.strmpr-view-more-stores-button');
+function render() {
+  const list = document.getElementById('storemapper-list');
+  for (const s of matches.slice(shown, shown + 10)) {
+    const div = document.createElement('div');
+    div.className = 'strmpr-search-result';
+    div.innerHTML = `<div class="strmpr-field-name">${s.name}</div>
+      <div class="strmpr-field-address">${s.address}</div>
+      <div class="strmpr-field-phone"><a href="tel:${s.phone}">${s.phone}</a></div>
+      <div class="strmpr-field-distance">12.3 mi</div>
+      <div class="strmpr-field-directions"><a href="https://maps.google.com/?daddr=${s.latitude},${s.longitude}">Directions</a></div>
+      <div class="strmpr-field-description">${s.description}</div>
+      ${s.custom_fields.map(f => `<div class="strmpr-field-custom">${f.value}</div>`).join('')}`;
+    list.appendChild(div);
+  }
+  shown = Math.min(shown + 10, matches.length);
+  more.classList.toggle('strmpr-hidden', shown >= matches.length);
+}
+document.getElementById('storemapper-go').onclick = () => {
+  const q = document.getElementById('storemapper-zip').value.toLowerCase();
+  matches = stores.filter(s => s.address.toLowerCase().includes(q));
+  if (!matches.length) matches = stores.slice(0, 25);
+  document.getElementById('storemapper-list').innerHTML = '';
+  shown = 0;
+  render();
+};
+more.onclick = render;
+</script>
+</body></html>
+"""
+
+SERP_PAGE = """<!doctype html>
+<html><head><title>{query} - Google Search</title></head>
+<body>
+<div class="IzNS7c">{website}</div>
+{phone}
+</body></html>
+"""
+
+
+class MockUpstream:
+    """
+    Stand-ins for the stockist search API, the khall admin-ajax locator, the
+    storemapper dataset/spa finder page and Google results pages, all answering
+    from one synthetic store set. `latency` (seconds, +/-50% jitter),
+    `rate_limit` (requests/second, answered with 429 + Retry-After) and
+    `error_rate` (fraction answered with 503) apply to the two locator APIs;
+    the storemapper and search pages are served as static pages.
+    """
+
+    def __init__(self, stores, latency=0.0, rate_limit=None, error_rate=0.0, cap=100, seed=0):
+        self.stores = stores
+        self.latency = latency
+        self.error_rate = error_rate
+        self.cap = cap
+        self._lats = [store['latitude'] for store in stores]
+        self._lons = [store['longitude'] for store in stores]
+        self._by_name = {store['name'].lower(): store for store in stores}
+        self._buckets = {api: TokenBucket(rate_limit) for api in ('stockist', 'khall')} if rate_limit else {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.throttled = Counter()
+        self.errors = Counter()
+
+    def nearby(self, lat, lon, distance):
+        """(miles, store) for stores within `distance` miles, nearest first, at most `cap` of them."""
+        distances = haversine_miles(lat, lon, self._lats, self._lons)
+        within = (distances <= distance).nonzero()[0]
+        nearest = sorted(within, key=lambda i: distances[i])[:self.cap]
+        return [(float(distances[i]), self.stores[i]) for i in nearest]
+
+    def _upstream_failure(self, api):
+        """429/503 to send instead of a normal answer, or None."""
+        with self._lock:
+            self.requests[api] += 1
+            roll = self._rng.random()
+            delay = self.latency * self._rng.uniform(0.5, 1.5) if self.latency else 0
+        if delay:
+            time.sleep(delay)
+        bucket = self._buckets.get(api)
+        if bucket and not bucket.allow():
+            with self._lock:
+                self.throttled[api] += 1
+            return 429
+        if roll < self.error_rate:
+            with self._lock:
+                self.errors[api] += 1
+            return 503
+        return None
+
+    def stockist_body(self, query):
+        lat, lon = float(query['latitude'][0]), float(query['longitude'][0])
+        distance = float(query.get('distance', ['100'])[0])
+        locations = [{
+            'id': store['id'],
+            'name': store['name'],
+            'latitude': f"{store['latitude']:.8f}",
+            'longitude': f"{store['longitude']:.8f}",
+            'address_line_1': store['street'].upper(),
+            'address_line_2': None,
+            'city': store['city'].upper(),
+            'state': store['state'],
+            'postal_code': store['postal_code'],
+            'country': 'UNITED STATES',
+            'full_address': None,
+            'phone': '({}) {}-{}'.format(*store['phone'].split('-')),
+            'website': store['website'],
+            'email': None,
+            'description': None,
+            'image_url': None,
+            'priority': 0,
+            'filters': [{'id': 684, 'name': 'Lollia', 'position': 1}],
+            'custom_fields': [],
+            'distance': round(miles),
+            'distance_units': 'mi',
+        } for miles, store in self.nearby(lat, lon, distance)]
+        return json.dumps({'locations': locations})
+
+    def khall_body(self, form):
+        lat, lon = float(form['latitude'][0]), float(form['longitude'][0])
+        distance = float(form.get('distance', ['500'])[0])
+        return json.dumps([{
+            'id': str(store['id']),
+            'name': store['name'].replace('&', '&#038;'),
+            'address': f"{store['street']}<br />\n\n{store['city']}, {store['state']} {store['postal_code']}",
+            'mapaddress': f"{store['street']}+\n\n{store['city']},+{store['state']}+{store['postal_code']}".replace(' ', '+'),
+            'phone': store['phone'],
+            'distance': f"{miles:.1f} Miles",
+            'latitude': str(store['latitude']),
+            'longitude': str(store['longitude']),
+        } for miles, store in self.nearby(lat, lon, distance)])
+
+    def storemapper_body(self):
+        return json.dumps({'stores': [{
+            'id': store['id'],
+            'name': store['name'],
+            'address': f"{store['street']}, {store['city']}, {store['state']} {store['postal_code']}",
+            'phone': store['phone'],
+            'latitude': store['latitude'],
+            'longitude': store['longitude'],
+            'description': f"Spa services at {store['name']}",
+            'custom_fields': [{'name': 'Services', 'value': 'Facials'}, {'name': 'Products', 'value': 'Body Care'}],
+        } for store in self.stores]})
+
+    def serp_body(self, query):
+        store = self._by_name.get(query.split(',', 1)[0].strip().lower())
+        phone = website = ''
+        if store:
+            phone = f'<span aria-label="Call phone number {store["phone"]}">{store["phone"]}</span>'
+            if store['website']:
+                website = f'<a class="ab_button" href="{store["website"]}"><div>Website</div></a>'
+        return SERP_PAGE.format(query=query, phone=phone, website=website)
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Starts serving from a background thread and returns the server; its base URL is server.base_url."""
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, body='', content_type='application/json', headers=None):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _api(self, api, render):
+                status = upstream._upstream_failure(api)
+                if status == 429:
+                    self._reply(429, '{"error": "rate limited"}', headers={'Retry-After': '1'})
+                elif status:
+                    self._reply(status, '{"error": "unavailable"}')
+                else:
+                    self._reply(200, render())
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                query = urllib.parse.parse_qs(url.query)
+                if url.path.startswith('/api/v1/') and url.path.endswith('/locations/search'):
+                    self._api('stockist', lambda: upstream.stockist_body(query))
+                    return
+                with upstream._lock:
+                    upstream.requests[url.path.strip('/').split('/')[0] or 'root'] += 1
+                if url.path == '/storemapper/stores.json':
+                    self._reply(200, upstream.storemapper_body())
+                elif url.path == '/pages/find-a-spa':
+                    self._reply(200, SPA_FINDER_PAGE, 'text/html; charset=utf-8')
+                elif url.path == '/search':
+                    self._reply(200, upstream.serp_body(query.get('q', [''])[0]), 'text/html; charset=utf-8')
+                else:
+                    self._reply(404, '{"error": "not found"}')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                if self.path == '/wp-admin/admin-ajax.php' and form.get('action') == ['acf_locations_limit']:
+                    self._api('khall', lambda: upstream.khall_body(form))
+                else:
+                    self._reply(404, '{"error": "not found"}')
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        server.base_url = f"http://{host}:{server.server_port}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve offline stand-ins for the stockist, khall, storemapper and Google endpoints.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cities', type=int, default=200)
+    parser.add_argument('--stores', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.05, help="Mean seconds per locator API response")
+    parser.add_argument('--rate-limit', type=float, help="Locator API requests per second before answering 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of locator API requests answered with 503")
+    args = parser.parse_args()
+
+    _, stores = synthetic_places(args.cities, args.stores)
+    server = MockUpstream(stores, args.latency, args.rate_limit, args.error_rate).serve(port=args.port)
+    base = server.base_url
+    print(f"Serving {len(stores)} stores on {base}")
+    print(f"  STOCKIST_BASE_URL={base} KHALL_BASE_URL={base} GOOGLE_SEARCH_URL={base}/search "
+          f"SPA_FINDER_URL={base}/pages/find-a-spa")
+    print(f"  new2store.py --mode direct --dataset-url {base}/storemapper/stores.json")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import argparse
+import json
+import os
+import re
 import time
-import pandas as pd
+import requests
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -7,10 +11,54 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
 
-def scrape_spas(city_file, output_file):
-    cities_df = pd.read_excel(city_file)
-    cities = cities_df['City'].tolist()
+from geo import haversine_miles
+from inputs import load_cities
+from metrics import add_metrics_arguments, finish_run, get_metrics, start_run
+from sinks import open_sink, export_xlsx
+
+SPA_COLUMNS = ['City', 'Spa Name', 'Address', 'Phone', 'Distance', 'Directions URL', 'Description', 'Services']
+# SPA_FINDER_URL points the scraper at another page, e.g. bench.py's mock
+SPA_FINDER_URL = os.environ.get('SPA_FINDER_URL', 'https://farmhousefreshgoods.com/pages/find-a-spa')
+SEARCH_RADIUS_MILES = 250
+
+LISTING_COUNT_JS = "return document.querySelectorAll('.strmpr-search-result').length;"
+
+# Scrolls the results list and clicks "Show More Stores"; returns false once there is nothing more to load
+SHOW_MORE_JS = """
+arguments[0].scrollBy(0, 300);
+const button = document.querySelector('.strmpr-view-more-stores-button');
+if (!button || button.classList.contains('strmpr-hidden')) return false;
+button.click();
+return true;
+"""
+
+# Serializes every listing's fields in one round trip; missing optional fields are null
+EXTRACT_LISTINGS_JS = """
+const text = (root, selector) => {
+    const el = root.querySelector(selector);
+    return el ? el.innerText.trim() : null;
+};
+return Array.from(document.querySelectorAll('.strmpr-search-result')).map(listing => {
+    const directions = listing.querySelector('.strmpr-field-directions a');
+    return {
+        name: text(listing, '.strmpr-field-name'),
+        address: text(listing, '.strmpr-field-address'),
+        phone: text(listing, '.strmpr-field-phone a'),
+        distance: text(listing, '.strmpr-field-distance'),
+        directions: directions ? directions.href : null,
+        description: text(listing, '.strmpr-field-description'),
+        services: Array.from(listing.querySelectorAll('.strmpr-field-custom'))
+            .map(field => field.innerText.trim()).filter(Boolean),
+    };
+});
+"""
+
+def scrape_spas(city_file, output_file, rows_file=None):
+    # Rows are streamed to rows_file (.csv/.jsonl/.parquet) per city and exported to output_file once at the end
+    rows_file = rows_file or output_file.rsplit('.', 1)[0] + '.csv'
+    cities = load_cities(city_file, ('city',))['city'].dropna().tolist()
 
     try:
         chrome_options = Options()
@@ -25,8 +73,7 @@ def scrape_spas(city_file, output_file):
         print(f"Error details: {str(e)}")
         raise e
 
-    url = 'https://farmhousefreshgoods.com/pages/find-a-spa'
-    driver.get(url)
+    driver.get(SPA_FINDER_URL)
     time.sleep(5)  # Allow page to fully load
 
     # ✅ FIX: Close popup if it exists
@@ -58,9 +105,9 @@ def scrape_spas(city_file, output_file):
         driver.quit()
         return
 
-    # Create an empty Excel file before starting to store data
-    df_empty = pd.DataFrame(columns=['City', 'Spa Name', 'Address', 'Phone', 'Distance', 'Directions URL', 'Description', 'Services'])
-    df_empty.to_excel(output_file, index=False)
+    # Start a fresh append-only row file before storing data
+    sink = open_sink(rows_file, SPA_COLUMNS)
+    metrics = get_metrics()
 
     for city in cities:
         print(f"🔎 Searching for spas in: {city}")
@@ -102,10 +149,12 @@ def scrape_spas(city_file, output_file):
 
         # Wait for results to load
         try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.ID, 'storemapper-list'))
-            )
+            with metrics.stage('browser_wait'):
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.ID, 'storemapper-list'))
+                )
         except:
+            metrics.record_error('timeout')
             print(f"❌ No results found for {city}")
             continue
 
@@ -116,71 +165,187 @@ def scrape_spas(city_file, output_file):
             print(f"❌ Could not locate results container for {city}")
             continue
 
-        # ✅ FIX: Click "Show More Stores" until all results load, scrolling inside the results section
+        # ✅ Click "Show More Stores" until all results load, waiting on the listing count instead of fixed sleeps
         while True:
+            count = driver.execute_script(LISTING_COUNT_JS)
+            clicked = driver.execute_script(SHOW_MORE_JS, results_container)
+            if not clicked:
+                break  # Button gone or hidden: no more stores to load
             try:
-                show_more_button = WebDriverWait(driver, 3).until(
-                    EC.element_to_be_clickable((By.CLASS_NAME, 'strmpr-view-more-stores-button'))
-                )
+                with metrics.stage('browser_wait'):
+                    WebDriverWait(driver, 10).until(lambda d: d.execute_script(LISTING_COUNT_JS) > count)
+            except TimeoutException:
+                break  # Click loaded nothing new, move on
 
-                driver.execute_script("arguments[0].scrollBy(0, 300);", results_container)
-                time.sleep(1)
-
-                if 'strmpr-hidden' in show_more_button.get_attribute('class'):
-                    break  # No more stores to load
-
-                show_more_button.click()
-                time.sleep(2)
-
-            except:
-                break  # No "Show More" button found, move on
-
-        # ✅ Extract spa details
+        # ✅ Extract spa details for every listing in one script call
         spa_data = []
-        listings = driver.find_elements(By.CSS_SELECTOR, '.strmpr-search-result')
-        for listing in listings:
-            try:
-                name = listing.find_element(By.CSS_SELECTOR, '.strmpr-field-name').text
-                address = listing.find_element(By.CSS_SELECTOR, '.strmpr-field-address').text
-                phone = listing.find_element(By.CSS_SELECTOR, '.strmpr-field-phone a').text if listing.find_elements(By.CSS_SELECTOR, '.strmpr-field-phone a') else "N/A"
-                distance = listing.find_element(By.CSS_SELECTOR, '.strmpr-field-distance').text if listing.find_elements(By.CSS_SELECTOR, '.strmpr-field-distance') else "N/A"
-                directions_url = listing.find_element(By.CSS_SELECTOR, '.strmpr-field-directions a').get_attribute("href") if listing.find_elements(By.CSS_SELECTOR, '.strmpr-field-directions a') else "N/A"
-                description = listing.find_element(By.CSS_SELECTOR, '.strmpr-field-description').text if listing.find_elements(By.CSS_SELECTOR, '.strmpr-field-description') else "N/A"
-
-                services = []
-                custom_fields = listing.find_elements(By.CSS_SELECTOR, '.strmpr-field-custom')
-                for field in custom_fields:
-                    service_text = field.text.strip()
-                    if service_text:
-                        services.append(service_text)
-
-                spa_data.append({
-                    'City': city,
-                    'Spa Name': name,
-                    'Address': address,
-                    'Phone': phone,
-                    'Distance': distance,
-                    'Directions URL': directions_url,
-                    'Description': description,
-                    'Services': "; ".join(services)  # Join services into one field
-                })
-            except Exception as e:
-                print(f"⚠ Error extracting data for a listing in {city}: {e}")
+        with metrics.stage('parse'):
+            records = driver.execute_script(EXTRACT_LISTINGS_JS)
+        for record in records:
+            if record['name'] is None or record['address'] is None:
+                print(f"⚠ Skipping a listing without name/address in {city}")
                 continue
+            spa_data.append({
+                'City': city,
+                'Spa Name': record['name'],
+                'Address': record['address'],
+                'Phone': record['phone'] or "N/A",
+                'Distance': record['distance'] or "N/A",
+                'Directions URL': record['directions'] or "N/A",
+                'Description': record['description'] or "N/A",
+                'Services': "; ".join(record['services'])  # Join services into one field
+            })
 
         # ✅ Save city data immediately
         if spa_data:
-            df_city = pd.DataFrame(spa_data)
-            with pd.ExcelWriter(output_file, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                df_city.to_excel(writer, index=False, header=False, startrow=writer.sheets['Sheet1'].max_row)
-
+            with metrics.stage('write'):
+                sink.write(spa_data)
+            metrics.count('rows', len(spa_data))
             print(f"✅ Saved results for {city} immediately!")
 
     driver.quit()
-    print(f"✅ Scraping completed! All data saved to {output_file}")
+    sink.close()
+    with metrics.stage('write'):
+        saved = export_xlsx(sink, output_file)
+    print(f"✅ Scraping completed! All {saved} rows saved to {output_file} (streamed copy in {rows_file})")
+
+def capture_storemapper_dataset(finder_url=SPA_FINDER_URL):
+    """
+    Loads the spa finder once with Chrome's network log enabled and returns the
+    body of the storemapper stores request the widget makes on startup.
+    """
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    service = Service(ChromeDriverManager().install())
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    try:
+        driver.get(finder_url)
+        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.ID, 'storemapper-zip')))
+        for _ in range(30):
+            for entry in driver.get_log('performance'):
+                message = json.loads(entry['message'])['message']
+                if message.get('method') != 'Network.responseReceived':
+                    continue
+                response_url = message['params']['response']['url']
+                if 'storemapper' in response_url and 'stores' in response_url:
+                    body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': message['params']['requestId']})
+                    print(f"✅ Captured storemapper dataset from {response_url}")
+                    return body['body']
+            time.sleep(1)
+        raise RuntimeError("Storemapper stores request not seen in the network log")
+    finally:
+        driver.quit()
+
+
+def parse_storemapper_dataset(body):
+    """Store records from a storemapper stores response (plain JSON or a JSONP wrapper)."""
+    text = body.strip()
+    if not text.startswith(('{', '[')):
+        text = re.sub(r'^[^(]*\(|\);?\s*$', '', text)
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get('stores') or data.get('data') or next((v for v in data.values() if isinstance(v, list)), [])
+    return [store for store in data if isinstance(store, dict)]
+
+
+def _store_services(store):
+    # Custom fields are what the listing shows under .strmpr-field-custom
+    services = []
+    for field in store.get('custom_fields') or []:
+        if not isinstance(field, dict):
+            services.append(str(field))
+        elif field.get('value') is True:
+            services.append(str(field.get('name', '')))
+        elif field.get('value') not in (None, '', False):
+            services.append(f"{field.get('name', '')}: {field['value']}")
+    return "; ".join(s for s in services if s)
+
+
+def scrape_spas_direct(city_file, output_file, rows_file=None, dataset_file=None, radius=SEARCH_RADIUS_MILES,
+                       dataset_url=None):
+    """
+    Same output as scrape_spas, but the storemapper dataset is fetched once and each
+    city's radius search runs locally. Cities need latitude/longitude in city_file.
+    The dataset comes from dataset_file, a plain GET of dataset_url, or Chrome.
+    """
+    rows_file = rows_file or output_file.rsplit('.', 1)[0] + '.csv'
+    if dataset_file:
+        with open(dataset_file, encoding='utf-8') as f:
+            body = f.read()
+    elif dataset_url:
+        with get_metrics().stage('fetch'):
+            response = requests.get(dataset_url, timeout=60)
+        response.raise_for_status()
+        body = response.text
+    else:
+        body = capture_storemapper_dataset()
+        with open('storemapper_stores.json', 'w', encoding='utf-8') as f:
+            f.write(body)  # reusable with --dataset-file
+
+    metrics = get_metrics()
+    stores = []
+    with metrics.stage('parse'):
+        dataset = parse_storemapper_dataset(body)
+    for store in dataset:
+        try:
+            stores.append((float(store['latitude']), float(store['longitude']), store))
+        except (KeyError, TypeError, ValueError):
+            continue  # no usable coordinates
+    store_lats = [lat for lat, _, _ in stores]
+    store_lons = [lon for _, lon, _ in stores]
+    print(f"✅ Loaded {len(stores)} spas from the storemapper dataset")
+
+    cities = load_cities(city_file, ('city', 'latitude', 'longitude'))
+    missing = cities[['latitude', 'longitude']].isna().any(axis=1)
+    if missing.any():
+        print(f"⚠ Skipping {int(missing.sum())} cities without coordinates")
+    cities = cities[~missing]
+
+    sink = open_sink(rows_file, SPA_COLUMNS)
+    for city, lat, lon in cities.itertuples(index=False):
+        with metrics.stage('search'):
+            distances = haversine_miles(lat, lon, store_lats, store_lons)
+        spa_data = []
+        for i in sorted((distances <= radius).nonzero()[0], key=lambda i: distances[i]):
+            store_lat, store_lon, store = stores[i]
+            spa_data.append({
+                'City': city,
+                'Spa Name': store.get('name', ''),
+                'Address': store.get('address', ''),
+                'Phone': store.get('phone') or "N/A",
+                'Distance': f"{distances[i]:.1f} mi",
+                'Directions URL': f"https://maps.google.com/?daddr={store_lat},{store_lon}",
+                'Description': store.get('description') or "N/A",
+                'Services': _store_services(store),
+            })
+        if spa_data:
+            with metrics.stage('write'):
+                sink.write(spa_data)
+            metrics.count('rows', len(spa_data))
+            print(f"✅ {len(spa_data)} spas within {radius} mi of {city}")
+
+    sink.close()
+    with metrics.stage('write'):
+        saved = export_xlsx(sink, output_file)
+    print(f"✅ Done! All {saved} rows saved to {output_file} (streamed copy in {rows_file})")
 
 # Main execution
 if __name__ == "__main__": 
+    parser = argparse.ArgumentParser(description="Collect farmhouse fresh spa locations around every city.")
+    parser.add_argument('--mode', choices=['browser', 'direct'], default='browser',
+                        help="Drive the spa finder UI per city, or fetch the storemapper dataset once and search it locally")
+    parser.add_argument('--dataset-file', help="Previously captured storemapper response to use in direct mode")
+    parser.add_argument('--dataset-url', help="Storemapper stores URL to fetch without a browser in direct mode")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_run('new2store.py', args)
+
     input_file = 'uscities.xlsx'
     output_file = 'spa_locations.xlsx'
-    scrape_spas(input_file, output_file)
+    rows_file = 'spa_locations.csv'  # or .jsonl / .parquet
+    if args.mode == 'direct':
+        scrape_spas_direct(input_file, output_file, rows_file, args.dataset_file, dataset_url=args.dataset_url)
+    else:
+        scrape_spas(input_file, output_file, rows_file)
+    finish_run(args)
@@ -1,35 +1,20 @@
-import pandas as pd
+import argparse
+import os
 import requests
-import time
-import random
-import re
 
-def parse_address(address):
-    """Extract city, state, and zip code from address string"""
-    try:
-        # Use regex to find state (2 letters) and zip (5 digits) at the end
-        match = re.search(r'([A-Z]{2})\s(\d{5})$', address)
-        if match:
-            state, zip_code = match.groups()
-            city_part = address.rsplit(f' {state} {zip_code}', 1)[0]
-            # Find city as the last word(s) before state
-            city = city_part.split()[-1]
-            if city.isupper():  # Handle cases where city might be abbreviated
-                city = city.title()
-            return city, state, zip_code
-        return '', '', ''
-    except:
-        return '', '', ''
-
-# Read input Excel file with coordinates
-input_file = 'uscities.xlsx'
-df = pd.read_excel(input_file)
-
-# Verify required columns
-if 'latitude' not in df.columns or 'longitude' not in df.columns:
-    raise ValueError("Excel file must contain 'latitude' and 'longitude' columns")
-
-results = []
+from addresses import parse_addresses
+from cache import cached_json, get_cache
+from checkpoint import Checkpoint
+from dedup import dedupe_into
+from http_client import get_client
+from inputs import load_points
+from metrics import add_metrics_arguments, finish_run, get_metrics, start_run
+from planner import plan_query_points
+from quadtree import quadtree_sweep
+from ratecontrol import get_controller
+from refresh import refresh
+from rowbuffer import RowBuffer
+from shards import add_sweep_arguments, check_sweep_arguments, resolve_journal
 
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36',
@@ -39,72 +24,199 @@ headers = {
     'X-Requested-With': 'XMLHttpRequest'
 }
 
-for index, row in df.iterrows():
-    lat = row['latitude']
-    lon = row['longitude']
-    
+# KHALL_BASE_URL points the sweep at another server, e.g. bench.py's mock
+KHALL_BASE_URL = os.environ.get('KHALL_BASE_URL', 'https://www.khallstudio.com')
+KHALL_AJAX_URL = KHALL_BASE_URL + '/wp-admin/admin-ajax.php'
+SEARCH_DISTANCE = '500'
+
+# Column kinds of the collected rows (see rowbuffer.KINDS); raw_data keeps the full response object compressed
+KHALL_SCHEMA = {
+    'id': 'str',
+    'name': 'str',
+    'address': 'str',
+    'mapaddress': 'str',
+    'latitude': 'float',
+    'longitude': 'float',
+    'country': 'category',
+    'phone': 'str',
+    'distance': 'str',
+    'raw_data': 'raw',
+}
+
+# Starts at the old average pace of one request per ~6.5 seconds and adapts from there
+KHALL_RATE_LIMITS = {'initial_rate': 1 / 6.5, 'min_rate': 0.05, 'max_rate': 1.0, 'increase': 0.01}
+
+
+def fetch_locations(lat, lon, distance=SEARCH_DISTANCE):
+    """Query the khall locator around one point and return the output rows, or None on failure."""
     payload = {
         'action': 'acf_locations_limit',
         'type': 'retailer',
-        'distance': '500',
+        'distance': distance if isinstance(distance, str) else f"{distance:.1f}",
         'latitude': lat,
         'longitude': lon
     }
-    
-    try:
-        # Add random delay between requests (2-15 seconds)
-        delay = random.uniform(3, 10)
-        time.sleep(delay)
-        
-        response = requests.post(
-            'https://www.khallstudio.com/wp-admin/admin-ajax.php',
-            headers=headers,
-            data=payload,
-            timeout=15
-        )
+
+    metrics = get_metrics()
+
+    def request():
+        # Wait for the next slot from the adaptive rate controller
+        controller = get_controller('khall', **KHALL_RATE_LIMITS)
+        with metrics.stage('rate_wait'):
+            controller.wait()
+
+        # Only the HTTP call counts as 'fetch', so time asleep in the controller stays under 'rate_wait'
+        with metrics.stage('fetch'):
+            response = get_client('khall', headers=headers, rate_controller=controller).post(
+                KHALL_AJAX_URL,
+                data=payload,
+                timeout=15
+            )
         response.raise_for_status()
-        
-        locations = response.json()
-        
-        for location in locations:
-            city, state, zip_code = parse_address(location.get('address', ''))
-            
-            entry = {
-                # 'query_latitude': lat,
-                # 'query_longitude': lon,
-                # 'result_latitude': location.get('latitude'),
-                # 'result_longitude': location.get('longitude'),
-                'name': location.get('name', ''),
-                'address': location.get('address', ''),
-                'city': city,
-                'state': state,
-                "mapaddress": location.get('mapaddress', ''),
-                'postal_code': zip_code,
-                'country': 'USA',
-                'phone': location.get('phone', '').replace('-', ''),
-                'distance': location.get('distance', ''),
-                'raw_data': str(location)  # Store complete data for reference
-            }
-            results.append(entry)
-            
+        return response.text
+
+    rows = []
+    try:
+        # Cached responses skip both the request and the rate limiter
+        locations = cached_json('khall', KHALL_AJAX_URL, payload, request)
+
+        # city/state/postal_code are parsed from 'address' in one batch when saving
+        with metrics.stage('parse'):
+            rows = [location_row(location) for location in locations]
+
         print(f"Processed {len(locations)} locations for coordinates {lat},{lon}")
-        
+
     except Exception as e:
+        # HTTP failures are counted by the client; anything else is a bad response
+        if not isinstance(e, requests.exceptions.RequestException):
+            metrics.record_error(e)
         print(f"Error processing {lat},{lon}: {str(e)}")
+        return None
+
+    return rows
+
+
+def location_row(location):
+    return {
+        'id': location.get('id', ''),
+        # 'query_latitude': lat,
+        # 'query_longitude': lon,
+        # The store's own coordinates, for storeindex.py
+        'latitude': location.get('latitude'),
+        'longitude': location.get('longitude'),
+        'name': location.get('name', ''),
+        'address': location.get('address', ''),
+        "mapaddress": location.get('mapaddress', ''),
+        'country': 'USA',
+        'phone': location.get('phone', '').replace('-', ''),
+        'distance': location.get('distance', ''),
+        'raw_data': location  # Store complete data for reference
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the khall retailer locator over every city in the input file.")
+    parser.add_argument('--input', default='uscities.xlsx')
+    parser.add_argument('--output', default='khall_locations.xlsx')
+    parser.add_argument('--plan-radius', type=float,
+                        help=f"Collapse the city list to query centres covering it within this many miles (searches use {SEARCH_DISTANCE} mi)")
+    parser.add_argument('--sweep', choices=['cities', 'quadtree'], default='cities',
+                        help="Query every city in --input, or subdivide the US wherever results come back capped")
+    parser.add_argument('--cap', type=int, default=100, help="Result count at which a quadtree cell is treated as truncated")
+    parser.add_argument('--no-cache', action='store_true', help="Always refetch instead of reusing cached responses")
+    parser.add_argument('--rate', type=float, default=KHALL_RATE_LIMITS['initial_rate'],
+                        help="Starting requests per second to khallstudio.com; adapts to how the site responds")
+    parser.add_argument('--max-rate', type=float, default=KHALL_RATE_LIMITS['max_rate'], help="Ceiling for the adaptive request rate")
+    add_sweep_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    check_sweep_arguments(parser, args)
+    metrics = start_run('newstore.py', args)
+    # A refresh is only worth doing against the live API
+    get_cache().enabled = not (args.no_cache or args.refresh)
+    # Created here first so fetch_locations picks up the command-line limits
+    get_controller('khall', **dict(KHALL_RATE_LIMITS, initial_rate=args.rate, max_rate=args.max_rate))
+    points, journal_file = resolve_journal(args)
+    # A refresh reads the last sweep's journal as its baseline, so it must not truncate it
+    journal = None if args.refresh else Checkpoint(journal_file, resume=args.resume)
+
+    if args.sweep == 'quadtree':
+        # fetch_locations already paces itself through the khall controller, so keep a single request in flight
+        with journal:
+            results = quadtree_sweep(fetch_locations, 'www.khallstudio.com', args.cap,
+                                     concurrency=1, rate=0, checkpoint=journal)
+        save_results(results, args.output)
+        finish_run(args)
+        return
+
+    if not args.manifest:
+        # Read the query coordinates (cached after the first read of the spreadsheet)
+        points = load_points(args.input)
+        if args.plan_radius:
+            planned = plan_query_points(points, args.plan_radius)
+            print(f"Planned {len(planned)} query points covering {len(points)} cities within {args.plan_radius} mi")
+            points = planned
+
+    if args.refresh:
+        # Change detection against the last refresh; the journal and full output are left alone
+        refresh(points, lambda due: [fetch_locations(lat, lon) for lat, lon in due], args.output,
+                args.refresh_budget, args.delta, prepare=_with_address_parts, journal_file=journal_file,
+                fields=KHALL_SCHEMA)
+        finish_run(args)
+        return
+
+    pending = journal.pending(points)
+    if len(pending) < len(points):
+        print(f"Skipping {len(points) - len(pending)} query points already in the journal")
+
+    with journal:
+        for lat, lon in pending:
+            # Each point's rows hit the journal on disk before the next request;
+            # failed points stay out of it so --resume retries them
+            rows = fetch_locations(lat, lon)
+            if rows is not None:
+                with metrics.stage('write'):
+                    journal.record((lat, lon), rows)
+                metrics.count('rows', len(rows))
+
+    if args.manifest:
+        # Deduplication and the spreadsheet happen once, in shards.py merge
+        print(f"Shard {args.shard} done: {len(journal.completed)} of {len(points)} query points in {journal.path}")
+    else:
+        save_results(journal.rows(), args.output)
+    finish_run(args)
+
+
+def _with_address_parts(df):
+    df[['city', 'state', 'postal_code']] = parse_addresses(df['address'])
+    return df
+
+
+def save_results(rows, output_file):
+    metrics = get_metrics()
+    # Drop stores already returned for a neighbouring query point, keeping the rest column by column
+    with metrics.stage('dedupe'):
+        results = dedupe_into(rows, RowBuffer(KHALL_SCHEMA))
+    metrics.count('unique_stores', len(results))
+
+    # Save results to Excel
+    if len(results):
+        with metrics.stage('parse'):
+            output_df = _with_address_parts(results.to_pandas())
+
+        # Custom column order
+        columns = [
+            'id',
+            'name', 'address', 'city', 'state', 'postal_code', 'country',
+            'phone', 'distance', 'mapaddress', 'latitude', 'longitude'
+        ]
+
+        with metrics.stage('write'):
+            output_df[columns].to_excel(output_file, index=False)
+        print(f"Saved {len(results)} locations to {output_file}")
+    else:
+        print("No locations found")
+
 
-# Save results to Excel
-if results:
-    output_df = pd.DataFrame(results)
-    output_file = 'khall_locations.xlsx'
-    
-    # Custom column order
-    columns = [
-        
-        'name', 'address', 'city', 'state', 'postal_code', 'country',
-        'phone', 'distance', 'mapaddress'
-    ]
-    
-    output_df[columns].to_excel(output_file, index=False)
-    print(f"Saved {len(results)} locations to {output_file}")
-else:
-    print("No locations found")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
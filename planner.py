@@ -0,0 +1,79 @@
+import heapq
+import math
+from collections import defaultdict
+
+from geo import EARTH_RADIUS_MILES
+
+
+def _to_xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _to_latlon(x, y, z):
+    norm = math.sqrt(x * x + y * y + z * z)
+    return (math.degrees(math.asin(z / norm)), math.degrees(math.atan2(y, x)))
+
+
+def _chord(miles):
+    """Straight-line distance on the unit sphere for a great-circle distance in miles."""
+    return 2 * math.sin(min(miles / EARTH_RADIUS_MILES, math.pi) / 2)
+
+
+def plan_query_points(points, radius_miles):
+    """
+    Picks a small set of query centres so that every (lat, lon) in `points` lies
+    within `radius_miles` of at least one centre.
+
+    Points are bucketed into a 3D grid over the unit sphere with cells half the
+    search radius wide; each occupied cell's centre is a candidate, and candidates
+    are chosen greedily by how many still-uncovered points they reach.
+    """
+    points = [(float(lat), float(lon)) for lat, lon in points
+              if not (math.isnan(float(lat)) or math.isnan(float(lon)))]
+    if not points:
+        return []
+
+    reach = _chord(radius_miles)
+    cell_size = reach / 2
+    xyz = [_to_xyz(lat, lon) for lat, lon in points]
+
+    cells = defaultdict(list)
+    for i, p in enumerate(xyz):
+        cells[tuple(int(math.floor(c / cell_size)) for c in p)].append(i)
+
+    # Candidates reach at most `reach` away, so only cells within `span` steps matter
+    span = int(math.ceil(reach / cell_size)) + 1
+    offsets = range(-span, span + 1)
+    covers = []
+    for cx, cy, cz in cells:
+        centre = _to_xyz(*_to_latlon((cx + 0.5) * cell_size, (cy + 0.5) * cell_size, (cz + 0.5) * cell_size))
+        covered = []
+        for dx in offsets:
+            for dy in offsets:
+                for dz in offsets:
+                    for i in cells.get((cx + dx, cy + dy, cz + dz), ()):
+                        if math.dist(centre, xyz[i]) <= reach:
+                            covered.append(i)
+        covers.append((centre, covered))
+
+    # Lazy greedy set cover: a candidate's gain only shrinks, so stale heap entries are re-scored on pop
+    uncovered = set(range(len(points)))
+    heap = [(-len(covered), n) for n, (_, covered) in enumerate(covers)]
+    heapq.heapify(heap)
+    chosen = []
+    while uncovered and heap:
+        neg_gain, n = heapq.heappop(heap)
+        centre, covered = covers[n]
+        gain = sum(1 for i in covered if i in uncovered)
+        if gain == 0:
+            continue
+        if gain < -neg_gain:
+            heapq.heappush(heap, (-gain, n))
+            continue
+        uncovered.difference_update(covered)
+        chosen.append(_to_latlon(*centre))
+
+    # Anything left over (only possible with a degenerate radius) is queried directly
+    chosen.extend(points[i] for i in sorted(uncovered))
+    return chosen
@@ -0,0 +1,105 @@
+import math
+
+from fetcher import fetch_all
+from geo import EARTH_RADIUS_MILES
+
+# Lower 48 states
+CONUS_BOUNDS = (24.4, -125.0, 49.4, -66.9)
+
+
+def cell_radius_miles(south, west, north, east):
+    """Great-circle distance from a cell's centre to its farthest corner."""
+    lat, lon = (south + north) / 2, (west + east) / 2
+    farthest = 0.0
+    for corner_lat in (south, north):
+        for corner_lon in (west, east):
+            p1, p2 = math.radians(lat), math.radians(corner_lat)
+            dlat, dlon = p2 - p1, math.radians(corner_lon - lon)
+            a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+            farthest = max(farthest, 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a)))
+    return farthest
+
+
+def split_cell(south, west, north, east):
+    mid_lat, mid_lon = (south + north) / 2, (west + east) / 2
+    return [
+        (south, west, mid_lat, mid_lon),
+        (south, mid_lon, mid_lat, east),
+        (mid_lat, west, north, mid_lon),
+        (mid_lat, mid_lon, north, east),
+    ]
+
+
+def initial_grid(bounds, rows, cols):
+    south, west, north, east = bounds
+    dlat, dlon = (north - south) / rows, (east - west) / cols
+    return [(south + r * dlat, west + c * dlon, south + (r + 1) * dlat, west + (c + 1) * dlon)
+            for r in range(rows) for c in range(cols)]
+
+
+def quadtree_sweep(fetch, host, cap, bounds=CONUS_BOUNDS, rows=4, cols=8,
+                   min_radius_miles=5.0, concurrency=8, rate=2.0, on_result=None, checkpoint=None, cached=None,
+                   max_retries=2):
+    """
+    Sweeps `bounds` starting from a coarse rows x cols grid. Each cell is queried
+    once at its centre with fetch(lat, lon, radius_miles), which must return a list
+    of rows, or None for a failed request. A cell whose response has `cap` or more
+    rows is treated as truncated and split into four; the sweep stops descending
+    once a cell is unsaturated or its radius drops below `min_radius_miles`. A failed
+    cell is retried with the next level, up to `max_retries` times, and reported if
+    it never succeeds.
+
+    `cached` is passed on to fetcher.fetch_all.
+
+    Returns every cell's rows concatenated; on_result(cell, rows) sees them as they arrive.
+    With a checkpoint.Checkpoint, each cell is journalled as it completes, cells
+    already in the journal are not fetched again, and the rows are read back from it.
+    """
+    results = []
+    attempts, abandoned = {}, []
+    level, cells = 0, initial_grid(bounds, rows, cols)
+    while cells:
+        todo = checkpoint.pending(cells) if checkpoint else cells
+        points = [((s + n) / 2, (w + e) / 2, cell_radius_miles(s, w, n, e)) for s, w, n, e in todo]
+        cell_for = dict(zip(points, todo))
+        counts = {}
+
+        def finished(point, cell_rows):
+            if cell_rows is None:
+                return
+            cell = cell_for[point]
+            counts[cell] = len(cell_rows)
+            if checkpoint:
+                checkpoint.record(cell, cell_rows)
+            else:
+                results.extend(cell_rows)
+            if on_result:
+                on_result(cell, cell_rows)
+
+        fetch_all(points, fetch, host, concurrency=concurrency, rate=rate, on_result=finished, cached=cached)
+
+        saturated, retry = [], []
+        for cell in cells:
+            if cell in counts:
+                count = counts[cell]
+            elif checkpoint and checkpoint.is_done(cell):
+                count = checkpoint.row_count(cell)
+            else:
+                # Failed: unknown whether it is saturated, so it is fetched again
+                attempts[cell] = attempts.get(cell, 0) + 1
+                (retry if attempts[cell] <= max_retries else abandoned).append(cell)
+                continue
+            if count >= cap and cell_radius_miles(*cell) / 2 >= min_radius_miles:
+                saturated.append(cell)
+
+        # Cells answered from the journal were not fetched in this run
+        journalled = len(cells) - len(todo)
+        print(f"Quadtree level {level}: {len(todo)} cells fetched, {len(todo) - len(counts)} failed, "
+              f"{journalled} already in the journal, {len(saturated)} saturated")
+        level, cells = level + 1, [child for cell in saturated for child in split_cell(*cell)] + retry
+    if abandoned:
+        print(f"Warning: {len(abandoned)} cells still failed after {max_retries} retries and are missing from the sweep: "
+              + ', '.join(f"({s:.3f}, {w:.3f}, {n:.3f}, {e:.3f})" for s, w, n, e in abandoned))
+    if checkpoint:
+        return list(checkpoint.rows())
+    return results
@@ -0,0 +1,116 @@
+import asyncio
+import email.utils
+import threading
+import time
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AimdRateController:
+    """
+    Per-provider request rate with additive increase / multiplicative decrease.
+    Every healthy response nudges the rate up by `increase` req/s; a 429/503,
+    a connection error or latency rising past `latency_factor` times the best
+    smoothed latency seen cuts it by `decrease`, at most once per cooldown.
+    Retry-After pauses all requests for the given time.
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.05, max_rate=10.0, increase=0.05,
+                 decrease=0.5, latency_factor=2.0, smoothing=0.2):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.smoothing = smoothing
+        self._rate = min(max(initial_rate, min_rate), max_rate)
+        self._latency = None
+        self._best_latency = None
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self.decreases = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """Current allowed requests per second."""
+        return self._rate
+
+    def reserve(self):
+        """Claims the next request slot and returns how many seconds to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + 1.0 / self._rate
+            return slot - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self, host=None):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _cut(self, now):
+        # One cut per cooldown, so a burst of concurrent 429s counts as one signal
+        if now - self._last_decrease < max(1.0, 1.0 / self._rate):
+            return
+        self._rate = max(self.min_rate, self._rate * self.decrease)
+        self._last_decrease = now
+        self.decreases += 1
+
+    def record(self, status=None, latency=None, retry_after=None):
+        """Feeds back one response (status None means the request failed outright)."""
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            if latency is not None:
+                self._latency = latency if self._latency is None else (
+                    self.smoothing * latency + (1 - self.smoothing) * self._latency)
+                if self._best_latency is None or self._latency < self._best_latency:
+                    self._best_latency = self._latency
+
+            if status is None or status in THROTTLE_STATUSES:
+                self._cut(now)
+            elif self._latency is not None and self._latency > self._best_latency * self.latency_factor:
+                self._cut(now)
+            elif status < 500:
+                self._rate = min(self.max_rate, self._rate + self.increase)
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(provider, **options):
+    """The shared controller for a provider, created with `options` on first use."""
+    with _controllers_lock:
+        if provider not in _controllers:
+            _controllers[provider] = AimdRateController(**options)
+        return _controllers[provider]
+
+
+def current_rates():
+    """{provider: requests per second} for monitoring."""
+    with _controllers_lock:
+        return {provider: controller.rate for provider, controller in _controllers.items()}
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import math
+import os
+import time
+
+import pandas as pd
+
+from checkpoint import journal_entries, point_key
+from dedup import store_key
+from metrics import get_metrics
+
+# Fields that depend on where a store was queried from, not on the store
+VOLATILE_FIELDS = ('query_latitude', 'query_longitude', 'distance', 'raw_data')
+
+# Share of the query points revisited per refresh when no budget is given
+DEFAULT_BUDGET_FRACTION = 0.1
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def store_id(row):
+    """Provider id of a row, or a stable stand-in for rows without one."""
+    value = row.get('id')
+    if value not in (None, '') and value == value:
+        return str(value)
+    return 'key:' + store_key(row).hex()
+
+
+def _canonical(value):
+    """One spelling per value, so 11216, 11216.0 and '11216' (an API vs a spreadsheet read-back) hash alike."""
+    if value is None:
+        return ''
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    if number != number:
+        return ''
+    return f"{number:.6f}".rstrip('0').rstrip('.')
+
+
+def row_hash(row):
+    content = {k: _canonical(v) for k, v in row.items() if k not in VOLATILE_FIELDS}
+    return _digest(json.dumps(content, sort_keys=True))
+
+
+def response_hash(rows):
+    """Content hash of one query point's normalized response, independent of row order."""
+    return _digest('\n'.join(sorted(f"{store_id(row)}={row_hash(row)}" for row in rows)))
+
+
+class RefreshState:
+    """
+    What the last refreshes saw: per query point, the response hash, the stores
+    it returned and how often it has changed; per store (by provider id), its
+    row, row hash and the query points that returned it. Saved as JSON next to
+    the output.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.points = {}
+        self.stores = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.points, self.stores = state['points'], state['stores']
+        self._changes = {}  # store id -> 'added' / 'removed' / 'modified' this run
+
+    def seed_from_journal(self, path):
+        """Takes a full sweep's journal as the first snapshot: every point's response, checked when it was written."""
+        checked = os.path.getmtime(path)
+        for point, rows in journal_entries(path):
+            self.update(point, rows, now=checked)
+        self._changes.clear()
+        print(f"Seeded the snapshot from {len(self.points)} query points and {len(self.stores)} stores in {path}")
+
+    def seed_from_output(self, path, fields):
+        """
+        Takes a full sweep's deduplicated output as the first snapshot. It has
+        no per-point responses, so its stores belong to no query point until a
+        refresh sees them; one not seen by any point after every point has been
+        checked is reported removed.
+        """
+        df = pd.read_excel(path, dtype=str)
+        columns = [c for c in fields if c in df.columns and c not in VOLATILE_FIELDS]
+        for row in df[columns].to_dict('records'):
+            row = {k: (None if v != v else v) for k, v in row.items()}
+            self.stores.setdefault(store_id(row), {'hash': row_hash(row), 'row': row, 'points': []})
+        print(f"Seeded the snapshot from {len(self.stores)} stores in {path}")
+
+    @staticmethod
+    def _key(point):
+        return ','.join(f"{v:.6f}" for v in point_key(point))
+
+    def change_rate(self, point):
+        entry = self.points.get(self._key(point))
+        if not entry:
+            return 1.0
+        # Smoothed so a region that never changed is still revisited eventually
+        return (entry['changes'] + 1) / (entry['checks'] + 2)
+
+    def schedule(self, points, budget, now=None):
+        """
+        Picks up to `budget` points to revisit: never-checked points first, then
+        by change rate times time since the last check, so busy regions come
+        round often and quiet ones rarely.
+        """
+        now = time.time() if now is None else now
+
+        def priority(point):
+            entry = self.points.get(self._key(point))
+            if not entry:
+                return float('inf')
+            return self.change_rate(point) * (now - entry['checked'])
+
+        return sorted(points, key=priority, reverse=True)[:budget]
+
+    def update(self, point, rows, now=None):
+        """Records a fresh response for one point; returns True if it differs from the last one."""
+        now = time.time() if now is None else now
+        key = self._key(point)
+        digest = response_hash(rows)
+        entry = self.points.setdefault(key, {'hash': None, 'checks': 0, 'changes': 0, 'checked': 0})
+        unchanged = entry['hash'] == digest
+        changed = entry['hash'] is not None and not unchanged
+        entry['checks'] += 1
+        entry['changes'] += changed
+        entry['checked'] = now
+        entry['hash'] = digest
+        if unchanged:
+            return False
+
+        seen = set()
+        for row in rows:
+            sid = store_id(row)
+            seen.add(sid)
+            self._observe(sid, key, row)
+
+        # Stores this point used to return but no longer does
+        previous, entry['stores'] = entry.get('stores', []), sorted(seen)
+        for sid in previous:
+            store = self.stores.get(sid)
+            if sid not in seen and store and key in store['points']:
+                store['points'].remove(key)
+                if not store['points']:
+                    # No query point returns it any more, unless a later point in this run does
+                    self._changes[sid] = None if self._changes.get(sid) == 'added' else 'removed'
+        return changed
+
+    def _observe(self, sid, key, row):
+        digest = row_hash(row)
+        store = self.stores.get(sid)
+        if store is None:
+            self.stores[sid] = {'hash': digest, 'row': {k: v for k, v in row.items() if k not in VOLATILE_FIELDS},
+                                'points': [key]}
+            self._changes[sid] = 'added'
+            return
+        if not store['points']:
+            # Dropped by one query point earlier in this run, picked up by another
+            if self._changes.get(sid, '') is None:
+                self._changes[sid] = 'added'
+            else:
+                self._changes.pop(sid, None)
+        if key not in store['points']:
+            store['points'].append(key)
+        if store['hash'] != digest:
+            store['hash'], store['row'] = digest, {k: v for k, v in row.items() if k not in VOLATILE_FIELDS}
+            self._changes.setdefault(sid, 'modified')
+
+    def expire_unseen(self, points):
+        """Once every point has been checked, seeded stores that no point returned are gone."""
+        if any(self._key(point) not in self.points for point in points):
+            return
+        for sid, store in self.stores.items():
+            if not store['points'] and sid not in self._changes:
+                self._changes[sid] = 'removed'
+
+    def delta(self):
+        """[(change, row)] for every store added, removed or modified since the state was loaded."""
+        return [(change, dict(self.stores[sid]['row'], id=self.stores[sid]['row'].get('id') or sid))
+                for sid, change in self._changes.items() if change]
+
+    def save(self):
+        # Stores removed this run; seeded ones waiting for their first sighting stay
+        for sid in [sid for sid, store in self.stores.items() if not store['points'] and sid in self._changes]:
+            del self.stores[sid]
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'points': self.points, 'stores': self.stores}, f, default=str)
+        os.replace(tmp, self.path)
+
+
+def write_delta(changes, path, prepare=None):
+    """Writes [(change, row)] to path with a leading 'change' column; prepare(df) may add or reorder columns."""
+    if not changes:
+        print("No stores added, removed or modified")
+        return
+    df = pd.DataFrame([row for _, row in changes])
+    if prepare:
+        df = prepare(df)
+    df.insert(0, 'change', [change for change, _ in changes])
+    df.to_excel(path, index=False)
+    counts = df['change'].value_counts()
+    print(f"Delta written to {path}: " + ', '.join(f"{counts.get(c, 0)} {c}" for c in ('added', 'removed', 'modified')))
+
+
+def refresh(points, fetch_many, output_file, budget=None, delta_file=None, prepare=None, journal_file=None,
+            fields=None):
+    """
+    Revisits the `budget` most change-prone of `points` (by default
+    DEFAULT_BUDGET_FRACTION of them) with fetch_many(points) (one row list, or
+    None on failure, per point) and writes only the stores added, removed or
+    modified since the last refresh to a delta file, keeping the snapshot in
+    <output>.refresh.json instead of rewriting the output.
+
+    Without a snapshot yet, the last full sweep is the baseline: its journal
+    when there is one, otherwise the `fields` of output_file's rows.
+    """
+    metrics = get_metrics()
+    state = RefreshState(output_file + '.refresh.json')
+    if not os.path.exists(state.path):
+        if journal_file and os.path.exists(journal_file):
+            state.seed_from_journal(journal_file)
+        elif fields and os.path.exists(output_file):
+            state.seed_from_output(output_file, fields)
+    if budget is None:
+        budget = max(1, math.ceil(len(points) * DEFAULT_BUDGET_FRACTION))
+    due = state.schedule(points, budget)
+    print(f"Refreshing {len(due)} of {len(points)} query points ({len(state.points)} checked before)")
+
+    changed = failed = 0
+    for point, rows in zip(due, fetch_many(due)):
+        if rows is None:
+            failed += 1  # Keeps its old check time, so it stays near the front of the queue
+            continue
+        changed += state.update(point, rows)
+    state.expire_unseen(points)
+    metrics.count('regions_changed', changed)
+    print(f"{changed} query points changed since their last check, {failed} failed")
+
+    changes = state.delta()
+    for change in ('added', 'removed', 'modified'):
+        metrics.count(f"stores_{change}", sum(1 for c, _ in changes if c == change))
+    with metrics.stage('write'):
+        stem = os.path.splitext(output_file)[0]
+        write_delta(changes, delta_file or f"{stem}.delta-{time.strftime('%Y%m%d-%H%M%S')}.xlsx", prepare)
+        state.save()
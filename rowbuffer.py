@@ -0,0 +1,166 @@
+import json
+import math
+import sys
+import zlib
+from array import array
+
+import numpy as np
+import pandas as pd
+
+KINDS = ('float', 'int', 'str', 'category', 'raw')
+
+
+def _numpy(values, dtype):
+    # Copied out, so the array can keep growing after a conversion
+    return np.frombuffer(values, dtype=dtype).copy() if len(values) else np.array([], dtype=dtype)
+
+
+def _missing(value):
+    return value is None or value == '' or value != value  # None, '' or NaN
+
+
+class RowBuffer:
+    """
+    Column-per-field accumulator for sweep rows with a fixed schema
+    ({column: kind}, kinds as in KINDS). Numbers live in typed arrays,
+    low-cardinality strings (state, country, ...) are stored once and referenced
+    by code, and 'raw' columns keep each value as zlib-compressed JSON.
+    Converts to pandas or Arrow column by column, without a list of dicts.
+    """
+
+    def __init__(self, schema):
+        unknown = {kind for kind in schema.values() if kind not in KINDS}
+        if unknown:
+            raise ValueError(f"Unknown column kinds {sorted(unknown)}, expected one of: {', '.join(KINDS)}")
+        self.schema = dict(schema)
+        self._columns = {}
+        self._masks = {}  # int columns: 1 where the value is missing
+        self._codes = {}  # category columns: value -> code
+        self._categories = {}  # category columns: values in code order
+        for name, kind in self.schema.items():
+            if kind == 'float':
+                self._columns[name] = array('d')
+            elif kind == 'int':
+                self._columns[name] = array('q')
+                self._masks[name] = bytearray()
+            elif kind == 'category':
+                self._columns[name] = array('i')
+                self._codes[name] = {}
+                self._categories[name] = []
+            else:
+                self._columns[name] = []
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def _encode(self, name, value):
+        kind = self.schema[name]
+        if kind == 'float':
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return math.nan
+        if kind == 'int':
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return None
+        if kind == 'category':
+            if _missing(value):
+                return -1
+            codes = self._codes[name]
+            if value not in codes:
+                value = sys.intern(value) if isinstance(value, str) else value
+                codes[value] = len(codes)
+                self._categories[name].append(value)
+            return codes[value]
+        if kind == 'raw':
+            return None if value is None else zlib.compress(json.dumps(value, default=str).encode('utf-8'))
+        return value
+
+    def append(self, row):
+        for name, kind in self.schema.items():
+            value = self._encode(name, row.get(name))
+            if kind == 'int':
+                self._masks[name].append(value is None)
+                value = 0 if value is None else value
+            self._columns[name].append(value)
+        self._length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def get(self, i, name):
+        kind = self.schema[name]
+        value = self._columns[name][i]
+        if kind == 'int' and self._masks[name][i]:
+            return None
+        if kind == 'float' and value != value:
+            return None
+        if kind == 'category':
+            return None if value < 0 else self._categories[name][value]
+        if kind == 'raw':
+            return None if value is None else json.loads(zlib.decompress(value))
+        return value
+
+    def set(self, i, name, value):
+        encoded = self._encode(name, value)
+        if self.schema[name] == 'int':
+            self._masks[name][i] = encoded is None
+            encoded = 0 if encoded is None else encoded
+        self._columns[name][i] = encoded
+
+    def row(self, i, include_raw=False):
+        return {name: self.get(i, name) for name, kind in self.schema.items() if include_raw or kind != 'raw'}
+
+    def rows(self, include_raw=False):
+        for i in range(self._length):
+            yield self.row(i, include_raw)
+
+    def _selected(self, columns, include_raw):
+        if columns is None:
+            return [name for name, kind in self.schema.items() if include_raw or kind != 'raw']
+        return list(columns)
+
+    def to_pandas(self, columns=None, include_raw=False):
+        data = {}
+        for name in self._selected(columns, include_raw):
+            kind, values = self.schema[name], self._columns[name]
+            if kind == 'float':
+                data[name] = _numpy(values, np.float64)
+            elif kind == 'int':
+                mask = np.frombuffer(bytes(self._masks[name]), dtype=np.bool_).copy()
+                data[name] = pd.arrays.IntegerArray(_numpy(values, np.int64), mask)
+            elif kind == 'category':
+                codes = _numpy(values, np.int32)
+                data[name] = pd.Categorical.from_codes(codes, self._categories[name])
+            elif kind == 'raw':
+                data[name] = [self.get(i, name) for i in range(self._length)]
+            else:
+                data[name] = pd.array(values, dtype=object)
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self, columns=None, include_raw=False):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Arrow output needs pyarrow: pip install pyarrow")
+        arrays = {}
+        for name in self._selected(columns, include_raw):
+            kind, values = self.schema[name], self._columns[name]
+            if kind == 'float':
+                arrays[name] = pa.array(_numpy(values, np.float64), from_pandas=True)
+            elif kind == 'int':
+                mask = np.frombuffer(bytes(self._masks[name]), dtype=np.bool_)
+                arrays[name] = pa.array(_numpy(values, np.int64), mask=mask)
+            elif kind == 'category':
+                codes = _numpy(values, np.int32)
+                indices = pa.array(codes, mask=codes < 0)
+                arrays[name] = pa.DictionaryArray.from_arrays(indices, pa.array(self._categories[name]))
+            elif kind == 'raw':
+                arrays[name] = pa.array([zlib.decompress(v) if v is not None else None for v in values], pa.string())
+            else:
+                arrays[name] = pa.array([None if v is None else str(v) for v in values], pa.string())
+        return pa.table(arrays)
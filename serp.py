@@ -0,0 +1,122 @@
+import sys
+import os
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+try:
+    from lxml import html as lxml_html
+    from lxml import etree
+except ImportError:  # the HTTP fast path is skipped without lxml
+    lxml_html = None
+
+PHONE_XPATH = "//span[contains(@aria-label, 'Call phone number')]"
+WEBSITE_XPATH = "//div[contains(@class, 'IzNS7c')]//a[contains(@class, 'ab_button') and .//div[text()='Website']]"
+CLOSED_MARKERS = ["Permanently closed", "Temporarily closed"]
+
+# GOOGLE_SEARCH_URL points the fast path at another server, e.g. bench.py's mock
+GOOGLE_SEARCH_URL = os.environ.get('GOOGLE_SEARCH_URL', 'https://www.google.com/search')
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+if lxml_html is not None:
+    _phone = etree.XPath(PHONE_XPATH)
+    _website = etree.XPath(WEBSITE_XPATH)
+    _closed = [(marker, etree.XPath(f"//*[contains(text(), '{marker}')]")) for marker in CLOSED_MARKERS]
+
+
+def build_query(store_name, address, city, state, postal_code):
+    return f"{store_name}, {address}, {city}, {state} {postal_code} phone"
+
+
+def search_url(query):
+    # URL-encode the entire query so special characters like & are preserved.
+    return GOOGLE_SEARCH_URL + "?q=" + urllib.parse.quote_plus(query) + "&hl=en"
+
+
+def phone_from_label(aria_label):
+    if aria_label.startswith("Call phone number "):
+        return aria_label[len("Call phone number "):].strip()
+    return aria_label.strip()
+
+
+def parse_serp(page):
+    """
+    Pulls phone, website and closed status out of a Google results page's HTML.
+    Returns (phone, website, is_closed); missing fields are None.
+    """
+    tree = lxml_html.fromstring(page)
+    phone = website = None
+    phones = _phone(tree)
+    if phones:
+        phone = phone_from_label(phones[0].get('aria-label', ''))
+    sites = _website(tree)
+    if sites:
+        website = sites[0].get('href')
+    is_closed = any(find(tree) for _, find in _closed)
+    return phone, website, is_closed
+
+
+_session_local = threading.local()
+
+
+def _session():
+    # One pooled keep-alive session per thread
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        _session_local.session = session
+    return session
+
+
+def fetch_info(store_name, address, city, state, postal_code):
+    """
+    Fast path: fetch the results page over plain HTTP and parse it.
+    Returns (phone, website, is_closed), or None when the page could not be
+    read (CAPTCHA, HTTP error, lxml missing) or had neither phone nor website,
+    in which case the caller should fall back to a browser.
+    """
+    if lxml_html is None:
+        return None
+    metrics = get_metrics()
+    query = build_query(store_name, address, city, state, postal_code)
+    start = time.monotonic()
+    try:
+        with metrics.stage('fetch'):
+            response = _session().get(search_url(query), timeout=15)
+        metrics.record_request('google', time.monotonic() - start, response.status_code)
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        print(f"[!] HTTP lookup failed for '{query}': {e}")
+        return None
+    except requests.exceptions.RequestException as e:
+        metrics.record_request('google', time.monotonic() - start, error=e)
+        print(f"[!] HTTP lookup failed for '{query}': {e}")
+        return None
+    if '/sorry/' in response.url or 'unusual traffic' in response.text[:5000].lower():
+        metrics.record_error('captcha')
+        print(f"[!] HTTP lookup hit a CAPTCHA for '{query}'")
+        return None
+    with metrics.stage('parse'):
+        phone, website, is_closed = parse_serp(response.content)
+    if phone is None and website is None:
+        return None
+    return phone, website, is_closed
+
+
+if __name__ == "__main__":
+    # Check the parser against saved pages: python serp.py page.html [...]
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            print(path, parse_serp(f.read()))
@@ -0,0 +1,242 @@
+import argparse
+import heapq
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from checkpoint import point_key, read_journal
+from inputs import load_points
+from planner import plan_query_points
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# provider -> script that sweeps one shard of it
+SHARD_SCRIPTS = {
+    'stockist': 'store.py',
+    'khall': 'newstore.py',
+}
+
+
+def geohash(lat, lon, precision):
+    """Standard base-32 geohash of a point, `precision` characters long."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def partition(points, shards, precision=3):
+    """
+    Splits points into `shards` groups of whole geohash cells, so neighbouring
+    points (and the stores they share) mostly land in the same shard. Cells are
+    handed out largest first to whichever shard has the fewest points so far.
+    Returns [(prefixes, points)] per shard.
+    """
+    cells = defaultdict(list)
+    for lat, lon in points:
+        cells[geohash(lat, lon, precision)].append((float(lat), float(lon)))
+
+    groups = [([], []) for _ in range(shards)]
+    heap = [(0, i) for i in range(shards)]
+    for prefix, cell_points in sorted(cells.items(), key=lambda item: (-len(item[1]), item[0])):
+        load, i = heapq.heappop(heap)
+        groups[i][0].append(prefix)
+        groups[i][1].extend(cell_points)
+        heapq.heappush(heap, (load + len(cell_points), i))
+    return [(sorted(prefixes), shard_points) for prefixes, shard_points in groups]
+
+
+def write_manifest(path, provider, points, shards, precision=3, **settings):
+    stem = os.path.basename(path)
+    stem = stem[:-len('.manifest.json')] if stem.endswith('.manifest.json') else os.path.splitext(stem)[0]
+    manifest = {
+        'provider': provider,
+        'precision': precision,
+        'created': time.time(),
+        'settings': settings,
+        'shards': [
+            {
+                'id': i,
+                'prefixes': prefixes,
+                'points': [[lat, lon] for lat, lon in shard_points],
+                # Each shard's journal doubles as its output for the merge step
+                'journal': f"{stem}.shard-{i:02d}.journal.jsonl",
+            }
+            for i, (prefixes, shard_points) in enumerate(partition(points, shards, precision))
+        ],
+    }
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def read_manifest(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _journal_path(manifest_path, shard):
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), shard['journal'])
+
+
+def load_shard(manifest_path, shard_id):
+    """(points, journal path) for one shard of a manifest."""
+    manifest = read_manifest(manifest_path)
+    shards = manifest['shards']
+    if not 0 <= shard_id < len(shards):
+        raise ValueError(f"{manifest_path} has shards 0-{len(shards) - 1}, not {shard_id}")
+    shard = shards[shard_id]
+    return [tuple(p) for p in shard['points']], _journal_path(manifest_path, shard)
+
+
+
+def add_sweep_arguments(parser):
+    """The journal, shard and refresh options store.py and newstore.py share."""
+    parser.add_argument('--journal', help="Checkpoint journal path (default: <output>.journal.jsonl)")
+    parser.add_argument('--resume', action='store_true', help="Skip query points already recorded in the journal")
+    parser.add_argument('--manifest', help="Shard manifest from shards.py plan; sweeps only the points of --shard")
+    parser.add_argument('--shard', type=int, help="Shard id to sweep; its journal is the shard's output for shards.py merge")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Revisit only the query points most likely to have changed and write a delta instead of the full output")
+    parser.add_argument('--refresh-budget', type=int, help="Query points to revisit per --refresh run (default: a tenth of them)")
+    parser.add_argument('--delta', help="Delta file for --refresh (default: <output stem>.delta-<timestamp>.xlsx)")
+
+
+def check_sweep_arguments(parser, args):
+    """Rejects option combinations add_sweep_arguments' options don't support."""
+    if (args.manifest is None) != (args.shard is None):
+        parser.error("--manifest and --shard go together")
+    if args.manifest and args.sweep == 'quadtree':
+        parser.error("shards cover the cities sweep only")
+    if args.refresh and (args.manifest or args.sweep == 'quadtree'):
+        parser.error("--refresh revisits the cities sweep's query points; it does not combine with shards or quadtree")
+
+
+def resolve_journal(args):
+    """(shard points, or None outside a shard, journal path) for a sweep's arguments."""
+    if args.manifest:
+        points, journal_path = load_shard(args.manifest, args.shard)
+        return points, args.journal or journal_path
+    return None, args.journal or args.output + '.journal.jsonl'
+
+
+def shard_rows(manifest_path):
+    """Every row from every shard journal, and the shard ids that are missing points."""
+    manifest = read_manifest(manifest_path)
+    rows, incomplete = [], []
+    for shard in manifest['shards']:
+        path = _journal_path(manifest_path, shard)
+        if not os.path.exists(path):
+            incomplete.append(shard['id'])
+            continue
+        completed, journal_rows = read_journal(path)
+        if any(point_key(p) not in completed for p in shard['points']):
+            incomplete.append(shard['id'])
+        rows.extend(journal_rows)
+    return rows, incomplete
+
+
+def plan(args):
+    points = load_points(args.input)
+    if args.plan_radius:
+        planned = plan_query_points(points, args.plan_radius)
+        print(f"Planned {len(planned)} query points covering {len(points)} cities within {args.plan_radius} mi")
+        points = planned
+    manifest = write_manifest(args.manifest, args.provider, points, args.shards, args.precision,
+                              input=args.input, plan_radius=args.plan_radius)
+    for shard in manifest['shards']:
+        print(f"Shard {shard['id']}: {len(shard['points'])} points in {len(shard['prefixes'])} geohash cells")
+    print(f"Manifest written to {args.manifest}")
+
+
+def run(args, script_args):
+    """Runs every shard as a local process, `workers` at a time; finished points are skipped via --resume."""
+    manifest = read_manifest(args.manifest)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), SHARD_SCRIPTS[manifest['provider']])
+    queue = [shard['id'] for shard in manifest['shards']]
+    running, failed = {}, []
+    while queue or running:
+        while queue and len(running) < args.workers:
+            shard_id = queue.pop(0)
+            command = [sys.executable, script, '--manifest', args.manifest, '--shard', str(shard_id), '--resume']
+            journal = _journal_path(args.manifest, manifest['shards'][shard_id])
+            log = open(journal[:-len('.journal.jsonl')] + '.log', 'a')
+            running[shard_id] = (subprocess.Popen(command + script_args, stdout=log, stderr=subprocess.STDOUT), log)
+            print(f"Started shard {shard_id}")
+        time.sleep(1)
+        for shard_id, (process, log) in list(running.items()):
+            if process.poll() is None:
+                continue
+            log.close()
+            del running[shard_id]
+            if process.returncode:
+                failed.append(shard_id)
+            print(f"Shard {shard_id} {'failed' if process.returncode else 'finished'}")
+    if failed:
+        print(f"Shards {failed} failed; rerun to resume them")
+        sys.exit(1)
+
+
+def merge(args):
+    manifest = read_manifest(args.manifest)
+    rows, incomplete = shard_rows(args.manifest)
+    if incomplete:
+        print(f"Warning: shards {incomplete} have not finished every query point")
+    print(f"Merging {len(rows)} rows from {len(manifest['shards'])} shards")
+    if manifest['provider'] == 'stockist':
+        import store
+        store.save_results(rows, args.output or 'output.xlsx', time.time())
+    else:
+        import newstore
+        newstore.save_results(rows, args.output or 'khall_locations.xlsx')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a sweep into geohash shards, run them, and merge the results.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = commands.add_parser('plan', help="Partition the query points into a shard manifest")
+    plan_parser.add_argument('--provider', choices=list(SHARD_SCRIPTS), required=True)
+    plan_parser.add_argument('--input', default='uscities.xlsx')
+    plan_parser.add_argument('--shards', type=int, required=True)
+    plan_parser.add_argument('--precision', type=int, default=3, help="Geohash length of the cells kept together")
+    plan_parser.add_argument('--plan-radius', type=float, help="Collapse the city list to query centres first")
+    plan_parser.add_argument('--manifest', required=True)
+
+    run_parser = commands.add_parser('run', help="Run every shard as a local process; extra arguments go to each shard")
+    run_parser.add_argument('--manifest', required=True)
+    run_parser.add_argument('--workers', type=int, default=4, help="Shards running at once")
+
+    merge_parser = commands.add_parser('merge', help="Combine and deduplicate every shard's rows")
+    merge_parser.add_argument('--manifest', required=True)
+    merge_parser.add_argument('--output', help="Defaults to the provider's usual output file")
+
+    args, extra = parser.parse_known_args()
+    if extra and args.command != 'run':
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command == 'plan':
+        plan(args)
+    elif args.command == 'run':
+        run(args, extra)
+    else:
+        merge(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+
+import pandas as pd
+
+
+class CsvSink:
+    """Appends rows to a CSV file; each write costs only the new rows."""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        self._writer.writeheader()
+        self._file.flush()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def read(self):
+        return pd.read_csv(self.path, dtype=str, keep_default_na=False)
+
+
+class JsonlSink:
+    """Appends rows to a JSON-lines file, one object per row."""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps({c: row.get(c) for c in self.columns}, default=str) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def read(self):
+        df = pd.read_json(self.path, lines=True, dtype=False)
+        return df.reindex(columns=self.columns)
+
+
+class ParquetSink:
+    """Writes each batch of rows as a new Parquet row group. Needs pyarrow."""
+
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow")
+        self._pa = pa
+        self.path = path
+        self.columns = list(columns)
+        self._schema = pa.schema([(c, pa.string()) for c in self.columns])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        batch = {c: [None if row.get(c) is None else str(row.get(c)) for row in rows] for c in self.columns}
+        self._writer.write_table(self._pa.Table.from_pydict(batch, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+    def read(self):
+        return pd.read_parquet(self.path)
+
+
+SINKS = {
+    '.csv': CsvSink,
+    '.jsonl': JsonlSink,
+    '.parquet': ParquetSink,
+}
+
+
+def open_sink(path, columns):
+    """Opens (and truncates) an append-only sink, picked by the file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SINKS:
+        raise ValueError(f"Unsupported sink format '{ext}', expected one of: {', '.join(SINKS)}")
+    return SINKS[ext](path, columns)
+
+
+def export_xlsx(sink, xlsx_path):
+    """One-shot export of everything written to a sink into a spreadsheet."""
+    df = sink.read()
+    df.to_excel(xlsx_path, index=False)
+    return len(df)
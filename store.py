@@ -1,75 +1,213 @@
-import pandas as pd
+import argparse
+import os
+import urllib.parse
 import requests
 import time
-import random
-
-# Read the input Excel file
-input_file = 'uscities.xlsx'  # Update with your input file name
-df = pd.read_excel(input_file)
-
-# Check if required columns exist
-if 'latitude' not in df.columns or 'longitude' not in df.columns:
-    raise ValueError("Excel file must contain 'latitude' and 'longitude' columns.")
-
-results = []
-total_requests = len(df)
-completed_requests = 0
-
-for index, row in df.iterrows():
-    lat = row['latitude']
-    lon = row['longitude']
-    
-    # Construct the API URL with current latitude and longitude
-    url = f"https://stockist.co/api/v1/u13410/locations/search?tag=u2517&latitude={lat}&longitude={lon}"
-    
-    try:
+
+from cache import cached_json, get_cache
+from checkpoint import Checkpoint
+from dedup import dedupe_into
+from fetcher import fetch_all
+from http_client import configure_client, get_client
+from inputs import load_points
+from metrics import add_metrics_arguments, finish_run, get_metrics, start_run
+from planner import plan_query_points
+from quadtree import quadtree_sweep
+from ratecontrol import get_controller
+from refresh import refresh
+from rowbuffer import RowBuffer
+from shards import add_sweep_arguments, check_sweep_arguments, resolve_journal
+
+# STOCKIST_BASE_URL points the sweep at another server, e.g. bench.py's mock
+STOCKIST_BASE_URL = os.environ.get('STOCKIST_BASE_URL', 'https://stockist.co')
+STOCKIST_HOST = urllib.parse.urlsplit(STOCKIST_BASE_URL).netloc
+STOCKIST_SEARCH_URL = STOCKIST_BASE_URL + '/api/v1/u13410/locations/search'
+
+# Column kinds of the output rows (see rowbuffer.KINDS), in output order
+STOCKIST_SCHEMA = {
+    'id': 'int',
+    'query_latitude': 'float',
+    'query_longitude': 'float',
+    'name': 'str',
+    'latitude': 'float',
+    'longitude': 'float',
+    'address_line_1': 'str',
+    'address_line_2': 'str',
+    'city': 'category',
+    'state': 'category',
+    'postal_code': 'category',
+    'country': 'category',
+    'phone': 'str',
+    'website': 'str',
+    'distance': 'float',
+}
+
+
+def search_params(lat, lon, distance=None):
+    # Query parameters for the current latitude and longitude
+    params = {'tag': 'u2517', 'latitude': lat, 'longitude': lon}
+    if distance is not None:
+        params['distance'] = f"{distance:.1f}"
+    return params
+
+
+def is_cached(lat, lon, distance=None):
+    """True when the search for this point can be answered from the response cache."""
+    return get_cache().has('stockist', STOCKIST_SEARCH_URL, search_params(lat, lon, distance))
+
+
+def fetch_locations(lat, lon, distance=None):
+    """
+    Fetch one stockist search and return the output rows for that query point,
+    or None if the request failed.
+    """
+    params = search_params(lat, lon, distance)
+
+    def request():
         # Send GET request to the API
-        response = requests.get(url, timeout=10)
+        response = get_client('stockist').get(STOCKIST_SEARCH_URL, params=params, timeout=10)
         response.raise_for_status()  # Raise exception for HTTP errors
-        completed_requests += 1
-        print(f"Completed request {completed_requests} of {total_requests} ({(completed_requests/total_requests)*100:.1f}%)")
-        
-        # Parse JSON response
-        data = response.json()
-        # print(data)
-        
+        return response.text
+
+    metrics = get_metrics()
+    rows = []
+    try:
+        # Parse JSON response, served from the response cache when fresh
+        with metrics.stage('fetch'):
+            data = cached_json('stockist', STOCKIST_SEARCH_URL, params, request)
+
         # Extract required fields from each location
-        for location in data.get('locations', []):
-            entry = {
-                'query_latitude': lat,
-                'query_longitude': lon,
-                'name': location.get('name', ''),
-                'address_line_1': location.get('address_line_1', ''),
-                'address_line_2': location.get('address_line_2', '') or '',
-                'city': location.get('city', ''),
-                'state': location.get('state', ''),
-                'postal_code': location.get('postal_code', ''),
-                'country': location.get('country', ''),
-                'phone': location.get('phone', ''),
-                'website': location.get('website', '')
-            }
-            results.append(entry)
-    
+        with metrics.stage('parse'):
+            rows = [location_row(lat, lon, location) for location in data.get('locations', [])]
+
     except requests.exceptions.RequestException as e:
+        # Failed requests are already counted by the HTTP client
         print(f"Request failed for lat={lat}, lon={lon}: {e}")
+        return None
     except ValueError as e:
+        metrics.record_error('parse')
         print(f"Failed to parse JSON response for lat={lat}, lon={lon}: {e}")
-    
-    
+        return None
+
+    return rows
+
+
+def location_row(lat, lon, location):
+    return {
+        'id': location.get('id', ''),
+        'query_latitude': lat,
+        'query_longitude': lon,
+        'name': location.get('name', ''),
+        'latitude': location.get('latitude'),
+        'longitude': location.get('longitude'),
+        'address_line_1': location.get('address_line_1', ''),
+        'address_line_2': location.get('address_line_2', '') or '',
+        'city': location.get('city', ''),
+        'state': location.get('state', ''),
+        'postal_code': location.get('postal_code', ''),
+        'country': location.get('country', ''),
+        'phone': location.get('phone', ''),
+        'website': location.get('website', ''),
+        'distance': location.get('distance', '')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the stockist locator over every city in the input file.")
+    parser.add_argument('--input', default='uscities.xlsx')
+    parser.add_argument('--output', default='output.xlsx')
+    parser.add_argument('--concurrency', type=int, default=8, help="Max requests in flight")
+    parser.add_argument('--rate', type=float, default=2.0, help="Starting requests per second to stockist.co; adapts to how the API responds")
+    parser.add_argument('--max-rate', type=float, default=10.0, help="Ceiling for the adaptive request rate")
+    parser.add_argument('--plan-radius', type=float, help="Collapse the city list to query centres covering it within this many miles")
+    parser.add_argument('--sweep', choices=['cities', 'quadtree'], default='cities',
+                        help="Query every city in --input, or subdivide the US wherever results come back capped")
+    parser.add_argument('--cap', type=int, default=100, help="Result count at which a quadtree cell is treated as truncated")
+    parser.add_argument('--no-cache', action='store_true', help="Always refetch instead of reusing cached responses")
+    parser.add_argument('--hedge-after', type=float, help="Send a duplicate request when one takes longer than this many seconds")
+    add_sweep_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    check_sweep_arguments(parser, args)
+    metrics = start_run('store.py', args)
+    # A refresh is only worth doing against the live API
+    get_cache().enabled = not (args.no_cache or args.refresh)
+    controller = get_controller('stockist', initial_rate=args.rate, max_rate=args.max_rate)
+    configure_client('stockist', pool_size=args.concurrency, hedge_after=args.hedge_after, rate_controller=controller)
+    points, journal_file = resolve_journal(args)
+    # A refresh reads the last sweep's journal as its baseline, so it must not truncate it
+    journal = None if args.refresh else Checkpoint(journal_file, resume=args.resume)
+
+    if args.sweep == 'quadtree':
+        start_time = time.time()
+        with journal:
+            results = quadtree_sweep(fetch_locations, STOCKIST_HOST, args.cap,
+                                     concurrency=args.concurrency, rate=controller, checkpoint=journal,
+                                     cached=is_cached)
+        save_results(results, args.output, start_time)
+        finish_run(args)
+        return
+
+    if not args.manifest:
+        # Read the query coordinates (cached after the first read of the spreadsheet)
+        points = load_points(args.input)
+        if args.plan_radius:
+            planned = plan_query_points(points, args.plan_radius)
+            print(f"Planned {len(planned)} query points covering {len(points)} cities within {args.plan_radius} mi")
+            points = planned
+
+    if args.refresh:
+        # Change detection against the last refresh; the journal and full output are left alone
+        refresh(points, lambda due: fetch_all(due, fetch_locations, STOCKIST_HOST, concurrency=args.concurrency,
+                                              rate=controller), args.output, args.refresh_budget, args.delta,
+                journal_file=journal_file, fields=STOCKIST_SCHEMA)
+        finish_run(args)
+        return
+    total_requests = len(points)
+    completed_requests = total_requests - len(journal.pending(points))
+    points = journal.pending(points)
+
+    def report(point, rows):
+        nonlocal completed_requests
+        if rows is None:
+            return  # Left out of the journal so --resume retries it
+        # Journal the point and its rows before counting it as done
+        with metrics.stage('write'):
+            journal.record(point, rows)
+        metrics.count('rows', len(rows))
+        completed_requests += 1
+        print(f"Completed request {completed_requests} of {total_requests} ({(completed_requests/total_requests)*100:.1f}%) at {controller.rate:.2f} req/s")
+
     start_time = time.time()
+    with journal:
+        fetch_all(points, fetch_locations, STOCKIST_HOST,
+                  concurrency=args.concurrency, rate=controller, on_result=report, cached=is_cached)
+    if args.manifest:
+        # Deduplication and the spreadsheet happen once, in shards.py merge
+        print(f"Shard {args.shard} done: {completed_requests} of {total_requests} query points in {journal.path}")
+    else:
+        save_results(journal.rows(), args.output, start_time)
+    finish_run(args)
+
+
+def save_results(rows, output_file, start_time):
+    metrics = get_metrics()
+    # Drop stores already returned for a neighbouring query point, keeping the rest column by column
+    with metrics.stage('dedupe'):
+        results = dedupe_into(rows, RowBuffer(STOCKIST_SCHEMA))
+    metrics.count('unique_stores', len(results))
+
+    # Create a DataFrame from the results and save to Excel
+    if len(results):
+        with metrics.stage('write'):
+            results_df = results.to_pandas()
+            results_df.to_excel(output_file, index=False)
+        print(f"Data successfully saved to {output_file}")
+        total_time = time.time() - start_time
+        print(f"\nTotal scraping time: {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
+    else:
+        print("No data was fetched from the API.")
+
 
-    delay = random.uniform(2, 6)
-    # print(f"Waiting for {delay:.2f} seconds before next request...")
-    time.sleep(delay)
-
-# Create a DataFrame from the results and save to Excel
-if results:
-    results_df = pd.DataFrame(results)
-    output_file = 'output.xlsx'  # Update with your desired output file name
-    results_df.to_excel(output_file, index=False)
-    print(f"Data successfully saved to {output_file}")
-    end_time = time.time()
-    total_time = end_time - start_time
-    # print(f"\nTotal scraping time: {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
-else:
-    print("No data was fetched from the API.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,43 @@
 import pandas as pd
 import requests
+import argparse
 import json
-from time import sleep
+import os
+import urllib.parse
+
+from cache import cached_json, get_cache
+from fetcher import fetch_all
+from http_client import configure_client, get_client
+from inputs import load_points
+from metrics import add_metrics_arguments, finish_run, get_metrics, start_run
+from planner import plan_query_points
+from ratecontrol import get_controller
+
+STOCKIST_BASE_URL = os.environ.get('STOCKIST_BASE_URL', 'https://stockist.co')
+STOCKIST_SEARCH_URL = STOCKIST_BASE_URL + "/api/v1/u2517/locations/search"
+
+def is_cached(latitude, longitude):
+    return get_cache().has('stockist', STOCKIST_SEARCH_URL, {'tag': 'u2517', 'latitude': latitude, 'longitude': longitude})
 
 def fetch_store_data(latitude, longitude):
     # API endpoint
-    url = f"https://stockist.co/api/v1/u2517/locations/search?tag=u2517&latitude={latitude}&longitude={longitude}"
-    
-    try:
-        response = requests.get(url)
+    params = {'tag': 'u2517', 'latitude': latitude, 'longitude': longitude}
+
+    def request():
+        response = get_client('stockist').get(STOCKIST_SEARCH_URL, params=params, timeout=10)
         response.raise_for_status()
-        return response.json()
+        return response.text
+
+    try:
+        with get_metrics().stage('fetch'):
+            return cached_json('stockist', STOCKIST_SEARCH_URL, params, request)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data: {e}")
         return None
+    except ValueError as e:
+        get_metrics().record_error('parse')
+        print(f"Error parsing data: {e}")
+        return None
 
 def extract_store_info(location):
     return {
@@ -29,39 +53,55 @@ def extract_store_info(location):
     }
 
 def main():
+    parser = argparse.ArgumentParser(description="Fetch stockist locations around every city in uscities.xlsx.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Max requests in flight")
+    parser.add_argument('--rate', type=float, default=1.0, help="Starting requests per second to stockist.co; adapts to how the API responds")
+    parser.add_argument('--plan-radius', type=float, help="Collapse the city list to query centres covering it within this many miles")
+    parser.add_argument('--no-cache', action='store_true', help="Always refetch instead of reusing cached responses")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics = start_run('storefider.py', args)
+    get_cache().enabled = not args.no_cache
+    controller = get_controller('stockist', initial_rate=args.rate)
+    configure_client('stockist', pool_size=args.concurrency, rate_controller=controller)
+
     # Read coordinates from Excel
     try:
-        df_coordinates = pd.read_excel('uscities.xlsx')
+        points = load_points('uscities.xlsx')
     except Exception as e:
         print(f"Error reading Excel file: {e}")
+        metrics.record_error(e)
+        finish_run(args)
         return
 
     # Store all results
     all_stores = []
 
-    # Process each coordinate
-    for index, row in df_coordinates.iterrows():
-        lat = row['lat']
-        lng = row['lng']
-        
-        # Fetch data
-        data = fetch_store_data(lat, lng)
-        
-        if data and 'locations' in data:
-            for location in data['locations']:
-                store_info = extract_store_info(location)
-                all_stores.append(store_info)
-        
-        # Add delay to avoid rate limiting
-        sleep(1)
+    # Fetch every coordinate, keeping within the stockist request budget
+    if args.plan_radius:
+        planned = plan_query_points(points, args.plan_radius)
+        print(f"Planned {len(planned)} query points covering {len(points)} cities within {args.plan_radius} mi")
+        points = planned
+    responses = fetch_all(points, fetch_store_data, urllib.parse.urlsplit(STOCKIST_BASE_URL).netloc,
+                          concurrency=args.concurrency, rate=controller, cached=is_cached)
+
+    with metrics.stage('parse'):
+        for data in responses:
+            if data and 'locations' in data:
+                for location in data['locations']:
+                    store_info = extract_store_info(location)
+                    all_stores.append(store_info)
+    metrics.count('rows', len(all_stores))
 
     # Save results to Excel
     if all_stores:
-        df_results = pd.DataFrame(all_stores)
-        df_results.to_excel('store_results.xlsx', index=False)
+        with metrics.stage('write'):
+            df_results = pd.DataFrame(all_stores)
+            df_results.to_excel('store_results.xlsx', index=False)
         print("Results saved to store_results.xlsx")
     else:
         print("No data found")
+    finish_run(args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,312 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from geo import chord_for_miles, miles_for_chord, unit_vectors
+from inputs import COLUMN_ALIASES
+
+LEAF_SIZE = 64
+DEFAULT_LIMIT = 100
+
+# Output fields of a stockist locations/search result, in order
+LOCATION_FIELDS = ['id', 'name', 'latitude', 'longitude', 'address_line_1', 'address_line_2', 'city', 'state',
+                   'postal_code', 'country', 'phone', 'website', 'source']
+
+_BREAK = re.compile(r'<br\s*/?>', re.IGNORECASE)
+
+
+class KdTree:
+    """
+    Static k-d tree over (n, 3) points with a bounding box per node; leaves
+    hold up to LEAF_SIZE points and are scanned with numpy.
+    """
+
+    def __init__(self, points):
+        self.order = np.arange(len(points))
+        self._lo, self._hi, self._ranges, self._children = [], [], [], []
+        if len(points):
+            self._build(np.asarray(points, dtype=float), 0, len(points))
+        # Leaves are contiguous slices once the points are stored in tree order
+        self.points = np.asarray(points, dtype=float)[self.order]
+
+    def _build(self, points, start, end):
+        node = len(self._ranges)
+        members = points[self.order[start:end]]
+        lo, hi = members.min(axis=0), members.max(axis=0)
+        self._lo.append(tuple(lo))
+        self._hi.append(tuple(hi))
+        self._ranges.append((start, end))
+        self._children.append(None)
+        if end - start > LEAF_SIZE:
+            axis = int(np.argmax(hi - lo))
+            mid = (start + end) // 2
+            segment = self.order[start:end]
+            self.order[start:end] = segment[np.argpartition(members[:, axis], mid - start)]
+            left = self._build(points, start, mid)
+            right = self._build(points, mid, end)
+            self._children[node] = (left, right)
+        return node
+
+    def _box_distance(self, node, p):
+        total = 0.0
+        for c, lo, hi in zip(p, self._lo[node], self._hi[node]):
+            gap = lo - c if c < lo else c - hi if c > hi else 0.0
+            total += gap * gap
+        return math.sqrt(total)
+
+    def within(self, p, reach):
+        """(positions in tree order, distances) of every point within `reach` of p."""
+        p, q = np.asarray(p, dtype=float), tuple(float(c) for c in p)
+        if not self._ranges:
+            return np.array([], dtype=int), np.array([])
+        hits, distances = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, q) > reach:
+                continue
+            children = self._children[node]
+            if children:
+                stack.extend(children)
+                continue
+            start, end = self._ranges[node]
+            d = np.linalg.norm(self.points[start:end] - p, axis=1)
+            inside = (d <= reach).nonzero()[0]
+            hits.append(inside + start)
+            distances.append(d[inside])
+        if not hits:
+            return np.array([], dtype=int), np.array([])
+        return np.concatenate(hits), np.concatenate(distances)
+
+    def nearest(self, p, k):
+        """(positions in tree order, distances) of the k points closest to p, nearest first."""
+        p, q = np.asarray(p, dtype=float), tuple(float(c) for c in p)
+        if not self._ranges or k <= 0:
+            return np.array([], dtype=int), np.array([])
+        best = []  # max-heap of (-distance, position)
+        queue = [(0.0, 0)]
+        while queue:
+            box_distance, node = heapq.heappop(queue)
+            if len(best) == k and box_distance > -best[0][0]:
+                break
+            children = self._children[node]
+            if children:
+                for child in children:
+                    heapq.heappush(queue, (self._box_distance(child, q), child))
+                continue
+            start, end = self._ranges[node]
+            d = np.linalg.norm(self.points[start:end] - p, axis=1)
+            nearest = np.argsort(d)[:k]
+            for i, distance in zip(nearest.tolist(), d[nearest].tolist()):
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, start + i))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, start + i))
+                else:
+                    break
+        best.sort(reverse=True)
+        return np.array([pos for _, pos in best], dtype=int), np.array([-neg for neg, _ in best])
+
+
+def _rename_coordinates(df):
+    for name in ('latitude', 'longitude'):
+        if name in df.columns:
+            continue
+        for alias in COLUMN_ALIASES[name]:
+            if alias in df.columns:
+                df = df.rename(columns={alias: name})
+                break
+    return df
+
+
+def read_dataset(path):
+    """Rows of one collected output file (.xlsx, .csv, .jsonl or .parquet) that have coordinates."""
+    ext = os.path.splitext(path)[1].lower()
+    # Text columns stay text, so ids, postal codes and phones are not turned into numbers
+    if ext == '.csv':
+        df = pd.read_csv(path, dtype=str)
+    elif ext == '.jsonl':
+        df = pd.read_json(path, lines=True, dtype=False)
+    elif ext == '.parquet':
+        df = pd.read_parquet(path)
+    else:
+        # Check the header first: older outputs without coordinates are large and useless here
+        if 'latitude' not in _rename_coordinates(pd.read_excel(path, nrows=0)).columns:
+            print(f"Skipping {path}: no latitude/longitude columns (re-run the sweep to collect them)")
+            return pd.DataFrame()
+        df = pd.read_excel(path, dtype=str)
+    df = _rename_coordinates(df)
+    if 'latitude' not in df.columns or 'longitude' not in df.columns:
+        print(f"Skipping {path}: no latitude/longitude columns (re-run the sweep to collect them)")
+        return df.iloc[0:0]
+    df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
+    df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
+    missing = df[['latitude', 'longitude']].isna().any(axis=1)
+    if missing.any():
+        print(f"Skipping {int(missing.sum())} rows without coordinates in {path}")
+    df = df[~missing].copy()
+    df['source'] = os.path.splitext(os.path.basename(path))[0]
+    return df
+
+
+def _clean(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return value
+
+
+def _location(row):
+    """A collected row in the stockist locations/search shape."""
+    location = {field: _clean(row.get(field)) for field in LOCATION_FIELDS}
+    address = _clean(row.get('address'))
+    if location['address_line_1'] is None and address:
+        # khall addresses are '<street><br />\n\n<city>, <state> <zip>'
+        location['address_line_1'] = _BREAK.split(str(address))[0].strip()
+    if isinstance(location['city'], str):
+        location['city'] = location['city'].rstrip(',')
+    return location
+
+
+class StoreIndex:
+    """Nearest-store and within-radius lookups over collected store rows."""
+
+    def __init__(self, stores):
+        self.stores = stores.reset_index(drop=True)
+        tree = KdTree(unit_vectors(self.stores['latitude'], self.stores['longitude']))
+        self._tree = tree
+        self._locations = [_location(row) for row in self.stores.to_dict('records')]
+
+    @classmethod
+    def from_files(cls, paths):
+        frames = [read_dataset(path) for path in paths]
+        frames = [df for df in frames if len(df)]
+        stores = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['latitude', 'longitude'])
+        return cls(stores)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _results(self, positions, chords):
+        results = []
+        for position, miles in zip(self._tree.order[positions].tolist(), miles_for_chord(chords).tolist()):
+            results.append(dict(self._locations[position], distance=round(miles, 2), distance_units='mi'))
+        return results
+
+    def nearest(self, lat, lon, k=10, max_distance=None):
+        """The k stores closest to (lat, lon), nearest first, optionally no further than max_distance miles."""
+        p = unit_vectors([lat], [lon])[0]
+        positions, chords = self._tree.nearest(p, k)
+        if max_distance is not None:
+            keep = chords <= chord_for_miles(max_distance)
+            positions, chords = positions[keep], chords[keep]
+        return self._results(positions, chords)
+
+    def within(self, lat, lon, radius_miles, limit=None):
+        """Stores within radius_miles of (lat, lon), nearest first, at most `limit` of them."""
+        p = unit_vectors([lat], [lon])[0]
+        positions, chords = self._tree.within(p, float(chord_for_miles(radius_miles)))
+        nearest_first = np.argsort(chords, kind='stable')[:limit]
+        return self._results(positions[nearest_first], chords[nearest_first])
+
+    def search(self, latitude, longitude, distance=None, limit=DEFAULT_LIMIT):
+        """Answers a stockist-style locations/search query."""
+        if distance is None:
+            return {'locations': self.nearest(latitude, longitude, limit)}
+        return {'locations': self.within(latitude, longitude, distance, limit)}
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves GET /api/v1/<tag>/locations/search?latitude=..&longitude=..[&distance=..][&limit=..]
+        (the stockist parameters) from a background thread and returns the server.
+        """
+        index = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                if not url.path.endswith('/locations/search'):
+                    self._reply(404, {'error': 'not found'})
+                    return
+                query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+                try:
+                    lat, lon = float(query['latitude']), float(query['longitude'])
+                    distance = float(query['distance']) if query.get('distance') else None
+                    limit = int(query.get('limit', DEFAULT_LIMIT))
+                except (KeyError, ValueError):
+                    self._reply(400, {'error': 'latitude and longitude are required numbers'})
+                    return
+                self._reply(200, index.search(lat, lon, distance, limit))
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving {len(self)} stores on http://{host}:{server.server_port}/api/v1/local/locations/search")
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer nearest-store queries from collected sweep outputs, offline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    data = argparse.ArgumentParser(add_help=False)
+    data.add_argument('--data', nargs='+', default=['output.xlsx', 'khall_locations.xlsx'],
+                      help="Collected outputs with latitude/longitude columns")
+
+    query_parser = commands.add_parser('query', parents=[data], help="Print the stores near one point")
+    query_parser.add_argument('latitude', type=float)
+    query_parser.add_argument('longitude', type=float)
+    query_parser.add_argument('--k', type=int, default=10, help="How many nearest stores to return")
+    query_parser.add_argument('--radius', type=float, help="Return every store within this many miles instead")
+
+    serve_parser = commands.add_parser('serve', parents=[data], help="Serve a stockist-compatible locations/search endpoint")
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    index = StoreIndex.from_files([path for path in args.data if os.path.exists(path)])
+    print(f"Indexed {len(index)} stores in {time.perf_counter() - start:.2f}s")
+
+    if args.command == 'query':
+        start = time.perf_counter()
+        if args.radius is not None:
+            results = index.within(args.latitude, args.longitude, args.radius)
+        else:
+            results = index.nearest(args.latitude, args.longitude, args.k)
+        elapsed = time.perf_counter() - start
+        for location in results:
+            print(f"{location['distance']:8.2f} mi  {location['name']}, {location['address_line_1']}, "
+                  f"{location['city']}, {location['state']}  [{location['source']}]")
+        print(f"{len(results)} stores in {elapsed * 1e6:.0f} µs")
+    else:
+        server = index.serve(args.port, args.host)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import json
+
+from checkpoint import Checkpoint, read_journal
+
+
+def test_resume_after_torn_write(tmp_path):
+    path = str(tmp_path / 'sweep.journal.jsonl')
+    with Checkpoint(path) as journal:
+        journal.record((1, 2), [{'id': 1}])
+    # A crash part-way through writing the next entry
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'point': [5, 6], 'rows': [{'id': 5}]})[:20])
+
+    with Checkpoint(path, resume=True) as journal:
+        assert journal.is_done((1, 2))
+        assert not journal.is_done((5, 6))
+        journal.record((3, 4), [{'id': 3}])
+        journal.record((5, 6), [{'id': 5}])
+        assert [row['id'] for row in journal.rows()] == [1, 3, 5]
+
+    completed, rows = read_journal(path)
+    assert set(completed) == {(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)}
+    assert len(rows) == 3
+
+
+def test_resume_keeps_complete_journal(tmp_path):
+    path = str(tmp_path / 'sweep.journal.jsonl')
+    with Checkpoint(path) as journal:
+        journal.record((1, 2), [{'id': 1}])
+    size = (tmp_path / 'sweep.journal.jsonl').stat().st_size
+    with Checkpoint(path, resume=True) as journal:
+        assert journal.is_done((1, 2))
+    assert (tmp_path / 'sweep.journal.jsonl').stat().st_size == size
+
+
+def test_resume_with_only_a_torn_line(tmp_path):
+    path = tmp_path / 'sweep.journal.jsonl'
+    path.write_text('{"point": [1, 2], "ro')
+    with Checkpoint(str(path), resume=True) as journal:
+        assert not journal.completed
+        journal.record((1, 2), [{'id': 1}])
+    assert read_journal(str(path))[1] == [{'id': 1}]
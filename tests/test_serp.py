@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+import serp
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+pytestmark = pytest.mark.skipif(serp.lxml_html is None, reason="parse_serp needs lxml")
+
+
+def parse_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return serp.parse_serp(f.read())
+
+
+def test_open_store_has_phone_and_website():
+    assert parse_fixture('serp_open.html') == ('(718) 555-0142', 'https://www.lolliaboutique.com/', False)
+
+
+def test_closed_store_without_website():
+    assert parse_fixture('serp_closed.html') == ('+1 512-555-0199', None, True)
+
+
+def test_page_without_knowledge_panel():
+    # Phone numbers and "Website" in ordinary results are not the store's
+    assert parse_fixture('serp_no_panel.html') == (None, None, False)
+
+
+def test_phone_from_label():
+    assert serp.phone_from_label("Call phone number 555-0100 ") == "555-0100"
+    assert serp.phone_from_label(" 555-0100") == "555-0100"